@@ -0,0 +1,60 @@
+import datetime
+import numpy as np
+import pandas as pd
+
+def series(points=781, seed=0, start=400.0, volatility=0.0005, date=datetime.date(2022, 5, 16), every=30):
+    """Generate a seeded random walk in the format influx returns.
+
+    Args:
+        points (int): Number of points.
+        seed (int): Random seed so runs are repeatable.
+        start (float): The first price.
+        volatility (float): Standard deviation of each step's return.
+        date (datetime.date): Session to start at. Times are 30s apart from the open.
+        every (int): Seconds between points.
+
+    Returns:
+        dataframe with _time and _value columns.
+    """
+    rng = np.random.default_rng(seed)
+    values = start * np.cumprod(1 + rng.normal(0, volatility, points))
+    opening = pd.Timestamp(datetime.datetime.combine(date, datetime.time(9, 30)), tz='America/New_York')
+    times = pd.date_range(opening.tz_convert('UTC'), periods=points, freq=f'{every}s')
+    return pd.DataFrame({'_time': times, '_value': np.round(values, 2)})
+
+def chain(expirations=20, strikes=100, seed=0, last=400.0, date=datetime.date(2022, 5, 16)):
+    """Generate a seeded options() response.
+
+    Args:
+        expirations (int): Number of daily expirations.
+        strikes (int): Number of strikes per expiration, centered on last.
+        seed (int): Random seed so runs are repeatable.
+        last (float): The underlying's price.
+        date (datetime.date): Day of the first expiration.
+
+    Returns:
+        dict in the format of spivey.Client.options()
+    """
+    rng = np.random.default_rng(seed)
+    ret = {'putExpDateMap': {}, 'callExpDateMap': {}}
+    first = round(last) - strikes // 2
+    for dte in range(expirations):
+        key = f'{(date + datetime.timedelta(days=dte)).isoformat()}:{dte}'
+        ret['putExpDateMap'][key] = {}
+        ret['callExpDateMap'][key] = {}
+        noise = rng.uniform(0, 2, (strikes, 2))
+        volume = rng.integers(0, 10000, strikes)
+        for i in range(strikes):
+            strike = float(first + i)
+            time_value = 0.5 + 0.1 * dte
+            ret['putExpDateMap'][key][f'{strike}'] = [{
+                'strikePrice': strike,
+                'mark': round(max(strike - last, 0) + time_value + noise[i][0], 2),
+                'totalVolume': int(volume[i]),
+            }]
+            ret['callExpDateMap'][key][f'{strike}'] = [{
+                'strikePrice': strike,
+                'mark': round(max(last - strike, 0) + time_value + noise[i][1], 2),
+                'totalVolume': int(volume[i]),
+            }]
+    return ret
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""Benchmark rj's hot paths against synthetic data.
+
+Everything runs offline. Results are compared to baseline.json and anything
+slower or bigger than the baseline by more than the tolerance is flagged.
+
+Usage:
+    python benchmarks/run.py            # compare against the baseline
+    python benchmarks/run.py --update   # record a new baseline
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from queue import Queue
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'scripts')]
+
+# pylint: disable=wrong-import-position
+from benchmarks import generators
+from rj.models import Evaluator
+from lib import backtest, session
+import find_limits
+import find_straddles
+import utils
+
+BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+# Memory growth smaller than this is noise, no matter the ratio
+MIN_BYTES = 64 * 1024
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark rj's hot paths")
+    parser.add_argument('--update', help='record results as the new baseline', action='store_true')
+    parser.add_argument('--tolerance', help='allowed slowdown as a fraction of the baseline', type=float, default=0.25)
+    parser.add_argument('--only', help='comma separated benchmarks to run', default='')
+    parser.add_argument('--repeat', help='times to run each benchmark', type=int, default=5)
+    parser.add_argument('--seed', help='seed for the generators', type=int, default=0)
+    parser.add_argument('--points', help='points in the underlying series', type=int, default=10000)
+    parser.add_argument('--expirations', help='expirations in the option chain', type=int, default=30)
+    parser.add_argument('--strikes', help='strikes per expiration in the option chain', type=int, default=200)
+    return parser.parse_args()
+
+def evaluator_eval(size):
+    """Evaluator.eval over a long series."""
+    df = generators.series(size['points'], size['seed'])
+    points = list(zip(df['_time'].dt.to_pydatetime(), df['_value'].tolist()))
+
+    def run():
+        e = Evaluator(20, 0.001, 30, None, Queue())
+        for t, v in points:
+            e.eval(t, v)
+    return run, len(points)
+
+def backtest_window_dataframe(size):
+    """BacktestWindow.eval on a dataframe, which includes indexing it."""
+    df = generators.series(781, size['seed'])
+    return lambda: backtest.main(df, 0.1, -0.1, '09:45:00'), len(df)
+
+def backtest_window_index(size):
+    """BacktestWindow.eval from every minute of a day against one index."""
+    index = backtest.FirstPassageIndex(generators.series(781, size['seed']))
+    minutes = session.grid()
+
+    def run():
+        for m in minutes:
+            backtest.main(index, 0.1, -0.1, m)
+    return run, len(minutes)
+
+def backtest_window_stream(size):
+    """BacktestWindow.eval on streamed records."""
+    df = generators.series(781, size['seed'])
+    records = list(zip(df['_time'].dt.to_pydatetime(), df['_value'].tolist()))
+    return lambda: backtest.main(iter(records), 0.1, -0.1, '09:45:00'), len(records)
+
+def utils_stats(size):
+    """utils.stats on a day of data."""
+    df = generators.series(781, size['seed'])
+    return lambda: utils.stats(df), len(df)
+
+def find_limits_grid(size):
+    """find_limits.sweep over every bracket and start minute of a day."""
+    df = generators.series(781, size['seed'])
+    return lambda: find_limits.sweep(df, progress=False), 20 * 781
+
+def find_straddles_scan(size):
+    """find_straddles flattening and scanning a wide chain."""
+    options = generators.chain(size['expirations'], size['strikes'], size['seed'])
+    threshold = find_straddles.THRESHOLDS['TSLA']
+
+    def run():
+        find_straddles.scan(find_straddles.to_array(options), threshold)
+    return run, size['expirations'] * size['strikes']
+
+BENCHMARKS = [
+    evaluator_eval,
+    backtest_window_dataframe,
+    backtest_window_index,
+    backtest_window_stream,
+    utils_stats,
+    find_limits_grid,
+    find_straddles_scan,
+]
+
+def measure(setup, size, repeat):
+    """Time a benchmark and find its peak memory.
+
+    Memory is measured on a separate run since tracing slows everything down.
+
+    Returns:
+        dict of format:
+            seconds: median wall time of a run
+            items/s: throughput
+            peak_bytes: peak memory allocated during a run
+    """
+    run, items = setup(size)
+    run() # Warm up
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    seconds = statistics.median(times)
+    return {'seconds': seconds, 'items/s': items / seconds, 'peak_bytes': peak}
+
+def compare(name, result, baseline, size, tolerance):
+    """Find how a result regressed from its baseline.
+
+    Returns:
+        list(str): What got worse. Empty if nothing did or there's no comparable baseline.
+    """
+    base = baseline.get(name)
+    if not base or base.get('size') != size:
+        return []
+    ret = []
+    if result['seconds'] > base['seconds'] * (1 + tolerance):
+        ret.append(f"seconds {result['seconds'] / base['seconds']:.2f}x")
+    grown = result['peak_bytes'] - base['peak_bytes']
+    if grown > MIN_BYTES and result['peak_bytes'] > base['peak_bytes'] * (1 + tolerance):
+        ret.append(f"peak_bytes {result['peak_bytes'] / base['peak_bytes']:.2f}x")
+    return ret
+
+def main(size, update=False, tolerance=0.25, only=None, repeat=5):
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+
+    flagged = []
+    print(f"{'benchmark':<28}{'seconds':>10}{'items/s':>14}{'peak MB':>10}  vs baseline")
+    for setup in BENCHMARKS:
+        name = setup.__name__
+        if only and name not in only:
+            continue
+        result = measure(setup, size, repeat)
+        regressions = compare(name, result, baseline, size, tolerance)
+        base = baseline.get(name)
+        ratio = f"{result['seconds'] / base['seconds']:.2f}x" if base and base.get('size') == size else '-'
+        print(f"{name:<28}{result['seconds']:>10.4f}{result['items/s']:>14.0f}"
+            f"{result['peak_bytes'] / 1024 / 1024:>10.2f}  {ratio} {' '.join(regressions)}")
+
+        if regressions:
+            flagged.append(name)
+        if update:
+            baseline[name] = {'size': size, 'seconds': result['seconds'], 'peak_bytes': result['peak_bytes']}
+
+    if update:
+        with open(BASELINE, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'[*] wrote {BASELINE}')
+    elif flagged:
+        print(f"[!] slower than the baseline by more than {tolerance:.0%}: {', '.join(flagged)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    sys.exit(main(
+        {'seed': args.seed, 'points': args.points, 'expirations': args.expirations, 'strikes': args.strikes},
+        args.update,
+        args.tolerance,
+        [o.strip() for o in args.only.split(',') if o.strip()],
+        args.repeat,
+    ))
@@ -2,7 +2,11 @@ import os
 import sys
 import logging
 from queue import Queue
-from .models import Poller, Evaluator, Trader
+from .models import AsyncPoller, Evaluator, EvaluatorBank, Trader
+from .chain import ChainPrefetcher
+from .notify import Notifier, TwilioTransport
+from .metrics import MetricsExporter
+from .state import Checkpoint, warm_start
 
 def configure():
     """Collect app settings from environment variables.
@@ -23,7 +27,17 @@ def configure():
             'twilio_from': os.getenv('TWILIO_FROM', '+1234567890'),
             'twilio_to': os.getenv('TWILIO_TO', '+1234567890'),
             'polling_interval': int(os.getenv('POLLING_INTERVAL', '30')),
+            'max_requests': int(os.getenv('MAX_REQUESTS', '4')),
+            'metrics_file': os.getenv('METRICS_FILE', 'metrics.json'),
+            'metrics_interval': int(os.getenv('METRICS_INTERVAL', '60')),
             'cooldown_points': int(os.getenv('COOLDOWN_POINTS', '80')),
+            'shadow': parse_shadow(os.getenv('SHADOW', '')),
+            'chain_interval': int(os.getenv('CHAIN_INTERVAL', '15')),
+            'chain_max_age': int(os.getenv('CHAIN_MAX_AGE', '60')),
+            'state_file': os.getenv('STATE_FILE', 'state.json'),
+            'state_max_age': int(os.getenv('STATE_MAX_AGE', '90')),
+            'influxdb_url': os.getenv('INFLUXDB_URL', ''), # Backfills after restarts if set
+            'influxdb_token': os.getenv('INFLUXDB_TOKEN', ''),
             'live_trading': os.getenv('LIVE_TRADING', 'ENABLED').upper(),
             'client_id': os.environ['CLIENT_ID'], # tdameritrade
             'refresh_token': os.environ['REFRESH_TOKEN'], # tdameritrade
@@ -35,6 +49,25 @@ def configure():
         print(f'Config error: {e} environment variable not found')
         sys.exit(1)
 
+def parse_shadow(value):
+    """Parse shadow configurations to evaluate next to the live one.
+
+    Args:
+        value (str): Comma separated points:change:cooldown_points, e.g. 4:0.0025:80,6:0.003:80
+
+    Returns:
+        list(dict)
+    """
+    ret = []
+    for i in filter(None, value.split(',')):
+        points, change, cooldown_points = i.split(':')
+        ret.append({
+            'points': int(points),
+            'change': float(change),
+            'cooldown_points': int(cooldown_points),
+        })
+    return ret
+
 def main():
     logging.basicConfig(format='%(asctime)s %(message)s',
         datefmt='%d/%B/%Y %I:%M:%S', level=logging.INFO)
@@ -44,16 +77,38 @@ def main():
     orderq = Queue()
 
     # Poll
-    p = Poller(config, pointq)
+    p = AsyncPoller(config, {config['ticker']: pointq})
     p.start()
 
     # Evaluate
-    e = Evaluator(config['points'], config['change'],
-            config['cooldown_points'], pointq, orderq)
+    checkpoint = Checkpoint(config['state_file']) if config['state_file'] else None
+    if config['shadow']:
+        # Shadow configurations share one thread with the live one. Trader only trades live orders.
+        live = {k: config[k] for k in ('points', 'change', 'cooldown_points')}
+        e = EvaluatorBank([{**live, 'tag': 'live'}] + config['shadow'], pointq, orderq, checkpoint)
+    else:
+        e = Evaluator(config['points'], config['change'],
+                config['cooldown_points'], pointq, orderq, checkpoint)
+    # Pick up the window and cooldown from before a restart so trading can resume right away
+    warm_start(e, config)
     e.start()
 
+    # Keep the option chain fresh so trades don't wait on it
+    c = ChainPrefetcher(config)
+    c.start()
+
+    # Notify without holding up trades
+    n = Notifier(TwilioTransport(config))
+    n.start()
+
     # Trade
-    t = Trader(config, orderq)
+    t = Trader(config, orderq, chains=c, notifier=n)
     t.start()
 
+    # Export latencies and queue depths
+    if config['metrics_file']:
+        m = MetricsExporter(config['metrics_file'], config['metrics_interval'],
+                {'pointq': pointq, 'orderq': orderq, 'notifyq': n.q})
+        m.start()
+
 # dont order before 10am and after 3pm
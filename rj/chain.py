@@ -0,0 +1,74 @@
+from threading import Thread, Event
+import logging
+import spivey
+from .clock import SystemClock
+
+class ChainPrefetcher(Thread):
+    """Background class to keep a fresh snapshot of the option chain.
+
+    Only expirations between dte_min and dte_max are kept since those are the
+    only ones Trader can pick from.
+    """
+    def __init__(self, config, client=None, clock=None):
+        """
+        Args:
+            config (dict): App settings.
+            client (spivey.Client): Broker client. Defaults to a new spivey.Client.
+            clock (SystemClock): Source of time. Defaults to the wall clock.
+        """
+        super().__init__(daemon=True)
+        self.client = client or spivey.Client()
+        self.clock = clock or SystemClock()
+        self.config = config
+        self.snapshot = None
+        self.fetched_at = None
+        self.stopping = Event()
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                self.fetch()
+            except Exception: # pylint: disable=broad-except
+                logging.exception('chain prefetch failed')
+            self.clock.sleep(self.config['chain_interval'])
+
+    def stop(self):
+        self.stopping.set()
+
+    def fetch(self):
+        """Fetch the chain and replace the snapshot.
+
+        Returns:
+            dict in the format of spivey.Client.options()
+        """
+        options = self.client.options(self.config['ticker'], self.config['days'])
+
+        snapshot = {}
+        for _key in ('putExpDateMap', 'callExpDateMap'):
+            snapshot[_key] = {}
+            for contract, strikes in options.get(_key, {}).items():
+                dte = int(contract.split(':')[1])
+                if self.config['dte_min'] <= dte <= self.config['dte_max']:
+                    snapshot[_key][contract] = strikes
+
+        # Swap both at once so readers never see a mismatched pair
+        self.snapshot, self.fetched_at = snapshot, self.clock.now()
+        return snapshot
+
+    def age(self):
+        """Seconds since the snapshot was fetched, None if it never was."""
+        if self.fetched_at is None:
+            return None
+        return (self.clock.now() - self.fetched_at).total_seconds()
+
+    def options(self):
+        """Return the snapshot, fetching synchronously if it's too old.
+
+        Returns:
+            dict in the format of spivey.Client.options()
+        """
+        age = self.age()
+        if age is None or age > self.config['chain_max_age']:
+            logging.info('chain snapshot is stale (%s seconds), fetching', age)
+            return self.fetch()
+        return self.snapshot
@@ -0,0 +1,29 @@
+from datetime import timedelta
+from datetime import datetime as dt
+from time import sleep
+
+class SystemClock():
+    """Class to read and wait on wall clock time"""
+    @staticmethod
+    def now():
+        return dt.utcnow()
+
+    @staticmethod
+    def sleep(seconds):
+        sleep(seconds)
+
+
+class VirtualClock():
+    """Class to simulate time. Sleeping advances the clock instantly."""
+    def __init__(self, start):
+        """
+        Args:
+            start (datetime.datetime): The UTC time to start at.
+        """
+        self._now = start
+
+    def now(self):
+        return self._now
+
+    def sleep(self, seconds):
+        self._now += timedelta(seconds=seconds)
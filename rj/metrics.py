@@ -0,0 +1,148 @@
+from collections import deque
+from threading import Thread, Lock, Event
+from time import monotonic
+import json
+import logging
+import os
+from .clock import SystemClock
+
+class Metrics():
+    """Class to aggregate stage latencies and gauges in process.
+
+    Percentiles are computed over the most recent samples of each stage so
+    they reflect current behavior instead of the whole run.
+    """
+    def __init__(self, samples=1024):
+        """
+        Args:
+            samples (int): The number of recent samples to keep per stage.
+        """
+        self.samples = samples
+        self.latencies = {}
+        self.counts = {}
+        self.maxes = {}
+        self.gauges = {}
+        self.lock = Lock()
+
+    def observe(self, name, seconds):
+        """Record how long a stage took."""
+        with self.lock:
+            if name not in self.latencies:
+                self.latencies[name] = deque(maxlen=self.samples)
+                self.counts[name] = 0
+                self.maxes[name] = seconds
+            self.latencies[name].append(seconds)
+            self.counts[name] += 1
+            self.maxes[name] = max(self.maxes[name], seconds)
+
+    def gauge(self, name, value):
+        """Record the current value of something."""
+        with self.lock:
+            self.gauges[name] = value
+
+    def record(self, marks, since=None, total=None):
+        """Record the time between each consecutive pair of marks.
+
+        Each stage is recorded under the later mark's name.
+
+        Args:
+            marks (dict(str: float)): Monotonic timestamps in the order the stages happened.
+            since (str): Only record stages after this mark.
+            total (str): Also record the time from the first recorded mark to the last under this name.
+        """
+        names = list(marks)
+        if since in marks:
+            names = names[names.index(since):]
+        for prev, name in zip(names, names[1:]):
+            self.observe(name, marks[name] - marks[prev])
+        if total and len(names) > 1:
+            self.observe(total, marks[names[-1]] - marks[names[0]])
+
+    def snapshot(self):
+        """Summarize every stage and gauge.
+
+        Returns:
+            dict of format:
+                latencies: {stage: {count, p50, p99, max}} in seconds
+                gauges: {name: value}
+        """
+        with self.lock:
+            latencies = {}
+            for name, values in self.latencies.items():
+                ordered = sorted(values)
+                latencies[name] = {
+                    'count': self.counts[name],
+                    'p50': self.percentile(ordered, 0.5),
+                    'p99': self.percentile(ordered, 0.99),
+                    'max': self.maxes[name],
+                }
+            return {'latencies': latencies, 'gauges': dict(self.gauges)}
+
+    @staticmethod
+    def percentile(ordered, p):
+        """Nearest rank percentile of sorted values."""
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+# Shared by every stage of the pipeline
+registry = Metrics()
+
+def mark(marks, name):
+    """Add the current monotonic time to marks under name.
+
+    Returns:
+        dict: marks
+    """
+    marks[name] = monotonic()
+    return marks
+
+
+class MetricsExporter(Thread):
+    """Class to periodically write metrics and queue depths to a file"""
+    def __init__(self, path, interval, queues=None, metrics=None, clock=None):
+        """
+        Args:
+            path (str): JSON file to write to. It's replaced atomically on every export.
+            interval (int): Seconds between exports.
+            queues (dict(str: Queue)): Queues to report the depth of.
+            metrics (Metrics): Metrics to export. Defaults to the shared registry.
+            clock (SystemClock): Source of time. Defaults to the wall clock.
+        """
+        super().__init__(daemon=True)
+        self.path = path
+        self.interval = interval
+        self.queues = queues or {}
+        self.metrics = metrics or registry
+        self.clock = clock or SystemClock()
+        self.stopping = Event()
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.clock.sleep(self.interval)
+            try:
+                self.export()
+            except OSError:
+                logging.exception('exporting metrics failed')
+
+    def stop(self):
+        """Export one last time and exit."""
+        self.stopping.set()
+        try:
+            self.export()
+        except OSError:
+            logging.exception('exporting metrics failed')
+
+    def export(self):
+        """Sample queue depths and write a snapshot."""
+        for name, q in self.queues.items():
+            self.metrics.gauge(f'{name}_depth', q.qsize())
+            if hasattr(q, 'dropped'):
+                self.metrics.gauge(f'{name}_dropped', q.dropped)
+
+        snapshot = self.metrics.snapshot()
+        snapshot['time'] = self.clock.now().isoformat()
+
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(snapshot, f, indent=2)
+        os.replace(tmp, self.path)
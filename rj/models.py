@@ -1,15 +1,19 @@
 from collections import deque
-from threading import Thread
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Event
+from time import monotonic
+import asyncio
 import datetime
 import logging
-from datetime import datetime as dt
 import spivey
 from twilio.rest import Client
+from .clock import SystemClock
+from .metrics import mark, registry
+from .pipeline import Worker
 
-class Evaluator(Thread):
+class Evaluator(Worker):
     """Event driven class to evaluate timeseries data for change."""
-    def __init__(self, max_points, change, cooldown_points, inq, outq):
+    def __init__(self, max_points, change, cooldown_points, inq, outq, checkpoint=None, order_max_age=None):
         """
         Args:
             max_points (int): The max number of points to evaluate.
@@ -17,22 +21,77 @@ class Evaluator(Thread):
             cooldown_points (int): The amount of points to ignore before evaluating again after a trigger.
             inq (Queue): Queue to consume from.
             outq (Queue): Queue to publish to.
+            checkpoint (Checkpoint): Where to save state after every point. Not saved if not set.
+            order_max_age (float): Seconds orders stay valid for. They never expire if not set.
         """
-        super().__init__()
+        super().__init__(inq)
         self.max_points = max_points
         self.change_threshold = change
         self.values = deque(maxlen=max_points)
         self.times = deque(maxlen=max_points)
         self.cooldown_points = cooldown_points
         self.cooldown_counter = 0
-        self.inq = inq
+        self.marks = {} # Stage timestamps of the point being evaluated
+        self.checkpoint = checkpoint
+        self.order_max_age = order_max_age
         self.outq = outq
 
-    def run(self):
-        while True:
-            p = self.inq.get()
-            self.eval(p.timestamp, p.value)
-            self.inq.task_done()
+    def handle(self, item):
+        self.marks = mark(dict(item.marks), 'eval')
+        self.eval(item.timestamp, item.value)
+        if self.checkpoint:
+            self.checkpoint.save(self.snapshot())
+        registry.record(self.marks)
+
+    def snapshot(self):
+        """Capture the state needed to pick up where this left off.
+
+        Returns:
+            dict
+        """
+        return {
+            'params': [self.max_points, self.change_threshold, self.cooldown_points],
+            'values': list(self.values),
+            'times': [t.isoformat() for t in self.times],
+            'cooldown': self.cooldown_counter,
+        }
+
+    def restore(self, state, missed, fresh):
+        """Pick up where a snapshot() left off.
+
+        Args:
+            state (dict): A snapshot().
+            missed (int): Points that were missed while stopped. They count towards the cooldown.
+            fresh (bool): Flag for whether the window is recent enough to keep.
+        """
+        if state['params'] != [self.max_points, self.change_threshold, self.cooldown_points]:
+            logging.warning('ignoring state saved with different settings %s', state['params'])
+            return
+        self.cooldown_counter = max(0, state['cooldown'] - missed)
+        if fresh:
+            self.values.extend(state['values'])
+            self.times.extend(datetime.time.fromisoformat(t) for t in state['times'])
+
+    def backfill(self, points):
+        """Replace the window with recent points so evaluation can start right away.
+
+        Args:
+            points (list(tuple(datetime.time, float))): Times and values, oldest first.
+        """
+        self.values.clear()
+        self.times.clear()
+        for timestamp, value in points[-self.max_points:]:
+            self.values.append(value)
+            self.times.append(timestamp)
+
+    @property
+    def size(self):
+        """The number of points the window holds."""
+        return self.max_points
+
+    def ready(self):
+        """Determine if the next point can be evaluated or is held back by the cooldown."""
+        return len(self.values) >= self.max_points - 1 or bool(self.cooldown_counter)
 
     def eval(self, timestamp, value):
         """Apply evaluation logic to the data.
@@ -66,12 +125,14 @@ class Evaluator(Thread):
         # Take positive and negative change_thresholds into account
         if self.change_threshold > 0:
             if changed >= self.change_threshold:
-                self.outq.put(Order('call', value))
+                self.outq.put(Order('call', value, marks=mark(dict(self.marks), 'order_enqueue'),
+                    max_age=self.order_max_age))
                 logging.info('call triggered by %s change', changed)
                 self.cooldown()
         else:
             if changed <= self.change_threshold:
-                self.outq.put(Order('put', value))
+                self.outq.put(Order('put', value, marks=mark(dict(self.marks), 'order_enqueue'),
+                    max_age=self.order_max_age))
                 logging.info('put triggered by %s change', changed)
                 self.cooldown()
 
@@ -94,13 +155,163 @@ class Evaluator(Thread):
         return round((current - start) / start, 4)
 
 
-class Trader(Thread):
+class EvaluatorBank(Worker):
+    """Event driven class to evaluate many configurations against one stream of points.
+
+    Points are stored once in a ring buffer shared by every configuration. Each
+    configuration only tracks how many points it has collected and its cooldown,
+    so the cost per point is O(number of configurations).
+    """
+    def __init__(self, configs, inq, outq, checkpoint=None, order_max_age=None):
+        """
+        Args:
+            configs (list(dict)): Configurations to evaluate. Each has points, change and
+                cooldown_points like configure() returns. An optional tag labels its orders.
+            inq (Queue): Queue to consume from.
+            outq (Queue): Queue to publish to.
+            checkpoint (Checkpoint): Where to save state after every point. Not saved if not set.
+            order_max_age (float): Seconds orders stay valid for. They never expire if not set.
+        """
+        super().__init__(inq)
+        self.params = [(c['points'], c['change'], c['cooldown_points']) for c in configs]
+        self.tags = [c.get('tag', f"{c['points']}:{c['change']}:{c['cooldown_points']}") for c in configs]
+        self.size = max(points for points, _, _ in self.params)
+        self.values = [0.0] * self.size
+        self.times = [None] * self.size
+        self.head = 0 # Total number of points seen
+        self.counts = [0] * len(configs) # Points collected since the last trigger
+        self.cooldown_counters = [0] * len(configs)
+        self.marks = {} # Stage timestamps of the point being evaluated
+        self.checkpoint = checkpoint
+        self.order_max_age = order_max_age
+        self.outq = outq
+
+    def handle(self, item):
+        self.marks = mark(dict(item.marks), 'eval')
+        self.eval(item.timestamp, item.value)
+        if self.checkpoint:
+            self.checkpoint.save(self.snapshot())
+        registry.record(self.marks)
+
+    def window(self):
+        """Return the buffered points, oldest first."""
+        start = max(0, self.head - self.size)
+        return [(self.times[i % self.size], self.values[i % self.size]) for i in range(start, self.head)]
+
+    def snapshot(self):
+        """Capture the state needed to pick up where this left off.
+
+        Returns:
+            dict
+        """
+        window = self.window()
+        return {
+            'params': [list(p) for p in self.params],
+            'values': [v for _, v in window],
+            'times': [t.isoformat() for t, _ in window],
+            'counts': list(self.counts),
+            'cooldowns': list(self.cooldown_counters),
+        }
+
+    def restore(self, state, missed, fresh):
+        """Pick up where a snapshot() left off.
+
+        Args:
+            state (dict): A snapshot().
+            missed (int): Points that were missed while stopped. They count towards the cooldowns.
+            fresh (bool): Flag for whether the window is recent enough to keep.
+        """
+        if state['params'] != [list(p) for p in self.params]:
+            logging.warning('ignoring state saved with different settings %s', state['params'])
+            return
+        self.cooldown_counters = [max(0, c - missed) for c in state['cooldowns']]
+        if fresh:
+            self.fill(zip((datetime.time.fromisoformat(t) for t in state['times']), state['values']))
+            self.counts = list(state['counts'])
+
+    def fill(self, points):
+        """Load points into the ring buffer without evaluating them."""
+        self.head = 0
+        for timestamp, value in points:
+            self.values[self.head % self.size] = value
+            self.times[self.head % self.size] = timestamp
+            self.head += 1
+
+    def backfill(self, points):
+        """Replace the window with recent points so evaluation can start right away.
+
+        Configurations in a cooldown keep waiting it out.
+
+        Args:
+            points (list(tuple(datetime.time, float))): Times and values, oldest first.
+        """
+        points = points[-self.size:]
+        self.fill(points)
+        self.counts = [0 if cooldown else len(points) for cooldown in self.cooldown_counters]
+
+    def ready(self):
+        """Determine if every configuration can evaluate the next point or is held back by its cooldown."""
+        return all(
+            self.counts[i] >= points - 1 or self.cooldown_counters[i]
+            for i, (points, _, _) in enumerate(self.params)
+        )
+
+    def eval(self, timestamp, value):
+        """Apply evaluation logic to the data for every configuration.
+
+        Args:
+            timestamp (datetime.datetime.time): The point's time.
+            value (float):  The point's value.
+        """
+        self.values[self.head % self.size] = value
+        self.times[self.head % self.size] = timestamp
+        self.head += 1
+
+        for i, (points, change_threshold, cooldown_points) in enumerate(self.params):
+            if self.cooldown_counters[i]:
+                self.cooldown_counters[i] -= 1
+                continue
+            self.counts[i] += 1
+
+            # Skip evaluation until we have enough points
+            if self.counts[i] < points:
+                continue
+
+            # Evaluate using the values of the first and last points in this config's window
+            first = self.values[(self.head - points) % self.size]
+            changed = Evaluator.percent_change(first, value)
+
+            if change_threshold > 0:
+                if changed >= change_threshold:
+                    self.trigger(i, 'call', value, changed, cooldown_points)
+            else:
+                if changed <= change_threshold:
+                    self.trigger(i, 'put', value, changed, cooldown_points)
+
+    def trigger(self, i, putCall, value, changed, cooldown_points):
+        self.outq.put(Order(putCall, value, self.tags[i], mark(dict(self.marks), 'order_enqueue'),
+            self.order_max_age))
+        logging.info('%s %s triggered by %s change', self.tags[i], putCall, changed)
+        self.cooldown_counters[i] = cooldown_points
+        self.counts[i] = 0
+
+
+class Trader(Worker):
     """Event driven class to make trades"""
-    def __init__(self, config, inq):
-        super().__init__()
-        self.client = spivey.Client()
+    def __init__(self, config, inq, client=None, chains=None, notifier=None):
+        """
+        Args:
+            config (dict): App settings.
+            inq (Queue): Queue to consume from.
+            client (spivey.Client): Broker client. Defaults to a new spivey.Client.
+            chains (ChainPrefetcher): Source of option chains. Chains are fetched on demand if not set.
+            notifier (Notifier): Sends notifications in the background. Sent inline if not set.
+        """
+        super().__init__(inq)
+        self.client = client or spivey.Client()
+        self.chains = chains
+        self.notifier = notifier
         self.config = config
-        self.inq = inq
         self.putCall = str
         self.last = float # Underlying ticker's price
         self.strike = str
@@ -110,28 +321,45 @@ class Trader(Thread):
         self.exp = str
         self.contracts = dict
 
-    def run(self):
-        while True:
-            order = self.inq.get()
-            self.putCall = order.putCall
-            self.last = order.last
-            self.set_strike()
+    def handle(self, item):
+        mark(item.marks, 'order_dequeue')
+        self.execute(item)
 
-            # Set exp and contracts
-            self.find_exp_by_dte()
+    def execute(self, order):
+        """Trade and notify on an order.
 
-            # These are used by trade(). They depend on find_exp_by_dte().
-            self.set_mark()
-            self.set_limit()
-            self.set_stop()
+        Args:
+            order (Order): The order to act on.
+        """
+        if order.tag not in (None, 'live'):
+            logging.info('shadow %s %s not traded', order.tag, order.putCall)
+            return
+        if order.expired():
+            logging.warning('%s order expired after %ss, not traded', order.putCall, round(order.age()))
+            return
+
+        self.putCall = order.putCall
+        self.last = order.last
+        self.set_strike()
 
-            if 'ENABLED' in self.config['live_trading']:
-                self.trade()
+        # Set exp and contracts
+        self.find_exp_by_dte()
+        mark(order.marks, 'chain')
 
-            msg = (f"{self.putCall} {self.exp} @ {self.strike} ${self.config['capital']}\n"
-                   f"mark={self.mark}, limit={self.limit}, stop={self.stop}")
-            self.notify(msg)
-            self.inq.task_done()
+        # These are used by trade(). They depend on find_exp_by_dte().
+        self.set_mark()
+        self.set_limit()
+        self.set_stop()
+
+        if 'ENABLED' in self.config['live_trading']:
+            self.trade()
+            mark(order.marks, 'buy_oco')
+
+        msg = (f"{self.putCall} {self.exp} @ {self.strike} ${self.config['capital']}\n"
+               f"mark={self.mark}, limit={self.limit}, stop={self.stop}")
+        self.notify(msg)
+        mark(order.marks, 'notify')
+        registry.record(order.marks, since='eval', total='trigger_to_notify')
 
     def trade(self):
         """Execute a trade"""
@@ -174,10 +402,13 @@ class Trader(Thread):
 
     def find_exp_by_dte(self):
         """Find the first expiration given a range of dtes"""
-        options = self.client.options(
-            self.config['ticker'],
-            self.config['days']
-        )
+        if self.chains:
+            options = self.chains.options()
+        else:
+            options = self.client.options(
+                self.config['ticker'],
+                self.config['days']
+            )
 
         _key = f'{self.putCall}ExpDateMap'
 
@@ -196,6 +427,10 @@ class Trader(Thread):
         Args:
             msg (str): Body of the message.
         """
+        if self.notifier:
+            self.notifier.notify(msg)
+            return
+
         client = Client(self.config['twilio_account_sid'], self.config['twilio_auth_token'])
 
         client.messages.create(
@@ -206,28 +441,125 @@ class Trader(Thread):
 
 
 class Poller(Thread):
-    def __init__(self, config, outq):
-        super().__init__()
-        self.client = spivey.Client()
+    def __init__(self, config, outq, client=None, clock=None):
+        """
+        Args:
+            config (dict): App settings.
+            outq (Queue): Queue to publish to.
+            client (spivey.Client): Broker client. Defaults to a new spivey.Client.
+            clock (SystemClock): Source of time. Defaults to the wall clock.
+        """
+        super().__init__(daemon=True)
+        self.client = client or spivey.Client()
+        self.clock = clock or SystemClock()
         self.config = config
         self.outq = outq
+        self.stopping = Event()
 
     def fetch_price(self):
         p = self.client.underlying(self.config['ticker'])
         logging.info('%s %s', self.config['ticker'], p)
         return p
 
+    def poll(self):
+        """Fetch a price and publish it."""
+        marks = mark({}, 'fetch_start')
+        last = self.fetch_price()
+        mark(marks, 'fetch_end')
+        if last:
+            self.outq.put(Point(self.clock.now().time(), last, mark(marks, 'enqueue')))
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.poll()
+            self.clock.sleep(self.config['polling_interval'])
+
+    def stop(self):
+        """Stop polling after the current interval."""
+        self.stopping.set()
+
+
+class AsyncPoller(Thread):
+    """Class to poll many tickers on a fixed cadence from one event loop.
+
+    Polls are scheduled on absolute deadlines so request latency doesn't
+    accumulate into drift. Every ticker shares one budget of in flight requests.
+    """
+    def __init__(self, config, outqs, client=None, clock=None):
+        """
+        Args:
+            config (dict): App settings.
+            outqs (dict(str: Queue)): Queue to publish each ticker's points to.
+            client (spivey.Client): Broker client. Defaults to a new spivey.Client.
+            clock (SystemClock): Source of point timestamps. Defaults to the wall clock.
+        """
+        super().__init__(daemon=True)
+        self.client = client or spivey.Client()
+        self.clock = clock or SystemClock()
+        self.config = config
+        self.outqs = outqs
+        self.stopping = Event()
+        self.loop = None
+        self.wakeup = None # Set to interrupt sleeps between polls
+
     def run(self):
-        while True:
-            last = self.fetch_price()
-            if last:
-                self.outq.put(Point(dt.utcnow().time(), last))
-            sleep(self.config['polling_interval'])
+        asyncio.run(self.main())
+
+    def stop(self):
+        """Stop polling. In flight requests finish but nothing new is scheduled."""
+        self.stopping.set()
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    async def main(self, ticks=None):
+        """Poll every ticker until stopped.
+
+        Args:
+            ticks (int): Stop after this many intervals. Runs forever if not set.
+        """
+        # Blocking fetches run in a pool sized to the budget instead of a thread per ticker
+        budget = asyncio.Semaphore(self.config['max_requests'])
+        self.wakeup = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(self.config['max_requests']) as executor:
+            start = asyncio.get_running_loop().time()
+            await asyncio.gather(
+                *(self.schedule(ticker, start, budget, executor, ticks) for ticker in self.outqs)
+            )
+
+    async def schedule(self, ticker, start, budget, executor, ticks):
+        """Poll one ticker at start + n * polling_interval."""
+        # pylint: disable=too-many-arguments
+        loop = asyncio.get_running_loop()
+        interval = self.config['polling_interval']
+        tick = 0
+        while (ticks is None or tick < ticks) and not self.stopping.is_set():
+            try:
+                async with budget:
+                    marks = mark({}, 'fetch_start')
+                    last = await loop.run_in_executor(executor, self.fetch_price, ticker)
+                    mark(marks, 'fetch_end')
+                if last:
+                    self.outqs[ticker].put(Point(self.clock.now().time(), last, mark(marks, 'enqueue')))
+            except Exception: # pylint: disable=broad-except
+                logging.exception('polling %s failed', ticker)
+
+            # Skip any deadlines that were missed instead of polling in a burst to catch up
+            tick = max(tick + 1, int((loop.time() - start) / interval) + 1)
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), max(0, start + tick * interval - loop.time()))
+            except asyncio.TimeoutError:
+                pass
+
+    def fetch_price(self, ticker):
+        p = self.client.underlying(ticker)
+        logging.info('%s %s', ticker, p)
+        return p
 
 
 class Point():
     """Class to encode a format for points when communicating between queues"""
-    def __init__(self, timestamp, value):
+    def __init__(self, timestamp, value, marks=None):
         if isinstance(timestamp, datetime.time):
             self._timestamp = timestamp
         else:
@@ -238,6 +570,8 @@ class Point():
         else:
             raise TypeError(value)
 
+        self._marks = marks if marks is not None else {}
+
     @property
     def timestamp(self):
         return self._timestamp
@@ -246,9 +580,14 @@ class Point():
     def value(self):
         return self._value
 
+    @property
+    def marks(self):
+        """Monotonic timestamps of each stage the point has been through."""
+        return self._marks
+
 class Order():
     """Class to encode a format for buy orders between queues"""
-    def __init__(self, putCall, last):
+    def __init__(self, putCall, last, tag=None, marks=None, max_age=None):
         if 'put' in putCall.lower() or 'call' in putCall.lower():
             self._putCall = putCall.lower()
         else:
@@ -259,6 +598,11 @@ class Order():
         else:
             raise TypeError(last)
 
+        self._tag = tag
+        self._marks = marks if marks is not None else {}
+        self._max_age = max_age
+        self._created = monotonic()
+
     @property
     def putCall(self):
         return self._putCall
@@ -266,3 +610,25 @@ class Order():
     @property
     def last(self):
         return self._last
+
+    @property
+    def tag(self):
+        """The configuration that triggered the order. None for the live Evaluator."""
+        return self._tag
+
+    @property
+    def marks(self):
+        """Monotonic timestamps of each stage the order has been through."""
+        return self._marks
+
+    @property
+    def max_age(self):
+        """Seconds the order is valid for. None if it never expires."""
+        return self._max_age
+
+    def age(self):
+        """Seconds since the order was created."""
+        return monotonic() - self._created
+
+    def expired(self):
+        return self._max_age is not None and self.age() > self._max_age
@@ -0,0 +1,219 @@
+from queue import Queue, Full, Empty
+from threading import Thread, Event
+import logging
+from twilio.rest import Client
+from .clock import SystemClock
+
+# Twilio won't send a body longer than this
+MAX_LENGTH = 1600
+
+class TwilioTransport():
+    """Class to send sms with one long lived twilio client"""
+    def __init__(self, config):
+        self.client = Client(config['twilio_account_sid'], config['twilio_auth_token'])
+        self.config = config
+
+    def send(self, body):
+        self.client.messages.create(
+            body = body,
+            from_ = self.config['twilio_from'],
+            to = self.config['twilio_to'],
+        )
+
+
+class FakeTransport():
+    """Class to record messages instead of sending them"""
+    def __init__(self, failures=0):
+        """
+        Args:
+            failures (int): The number of sends to fail before succeeding.
+        """
+        self.failures = failures
+        self.sent = []
+
+    def send(self, body):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('fake transport failure')
+        self.sent.append(body)
+
+
+class Notifier(Thread):
+    """Event driven class to send notifications without blocking the caller.
+
+    Messages queued while a send is in flight are coalesced into one message.
+    """
+    def __init__(self, transport, maxsize=100, retries=3, backoff=1.0, clock=None):
+        """
+        Args:
+            transport (TwilioTransport): Sends a message body.
+            maxsize (int): Max number of queued messages. The oldest is dropped when full.
+            retries (int): Number of times to retry a failed send.
+            backoff (float): Seconds to wait before the first retry. Doubles every retry.
+            clock (SystemClock): Source of time. Defaults to the wall clock.
+        """
+        super().__init__(daemon=True)
+        self.transport = transport
+        self.q = Queue(maxsize)
+        self.retries = retries
+        self.backoff = backoff
+        self.clock = clock or SystemClock()
+        self.pending = None # Message that didn't fit in the last batch
+        self.stopping = Event()
+
+    def notify(self, msg):
+        """Queue a message and return immediately.
+
+        Args:
+            msg (str): Body of the message.
+        """
+        while True:
+            try:
+                self.q.put_nowait(msg)
+                return
+            except Full:
+                try:
+                    logging.warning('notification queue full, dropped %r', self.q.get_nowait())
+                    self.q.task_done()
+                except Empty:
+                    pass
+
+    def run(self):
+        while True:
+            self.dispatch()
+
+    def dispatch(self):
+        """Wait for messages then send everything queued as one message."""
+        batch = [self.pending] if self.pending is not None else [self.q.get()]
+        self.pending = None
+
+        while True:
+            try:
+                msg = self.q.get_nowait()
+            except Empty:
+                break
+            if len('\n\n'.join(batch + [msg])) > MAX_LENGTH:
+                self.pending = msg
+                break
+            batch.append(msg)
+
+        self.send('\n\n'.join(batch))
+        for _ in batch:
+            self.q.task_done()
+
+    def send(self, body):
+        self.client.messages.create(
+            body = body,
+            from_ = self.config['twilio_from'],
+            to = self.config['twilio_to'],
+        )
+
+
+class FakeTransport():
+    """Class to record messages instead of sending them"""
+    def __init__(self, failures=0):
+        """
+        Args:
+            failures (int): The number of sends to fail before succeeding.
+        """
+        self.failures = failures
+        self.sent = []
+
+    def send(self, body):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('fake transport failure')
+        self.sent.append(body)
+
+
+class Notifier(Thread):
+    """Event driven class to send notifications without blocking the caller.
+
+    Messages queued while a send is in flight are coalesced into one message.
+    """
+    def __init__(self, transport, maxsize=100, retries=3, backoff=1.0, clock=None):
+        """
+        Args:
+            transport (TwilioTransport): Sends a message body.
+            maxsize (int): Max number of queued messages. The oldest is dropped when full.
+            retries (int): Number of times to retry a failed send.
+            backoff (float): Seconds to wait before the first retry. Doubles every retry.
+            clock (SystemClock): Source of time. Defaults to the wall clock.
+        """
+        super().__init__()
+        self.transport = transport
+        self.q = Queue(maxsize)
+        self.retries = retries
+        self.backoff = backoff
+        self.clock = clock or SystemClock()
+        self.pending = None # Message that didn't fit in the last batch
+
+    def notify(self, msg):
+        """Queue a message and return immediately.
+
+        Args:
+            msg (str): Body of the message.
+        """
+        while True:
+            try:
+                self.q.put_nowait(msg)
+                return
+            except Full:
+                try:
+                    logging.warning('notification queue full, dropped %r', self.q.get_nowait())
+                    self.q.task_done()
+                except Empty:
+                    pass
+
+    def run(self):
+        while not (self.stopping.is_set() and self.q.empty() and self.pending is None):
+            self.dispatch(timeout=0.1)
+
+    def stop(self):
+        """Send what's queued then exit."""
+        self.stopping.set()
+
+    def dispatch(self, timeout=None):
+        """Wait for messages then send everything queued as one message.
+
+        Args:
+            timeout (float): Seconds to wait for a message. Waits forever if not set.
+        """
+        if self.pending is None:
+            try:
+                self.pending = self.q.get(timeout=timeout)
+            except Empty:
+                return
+            self.q.task_done()
+        batch = [self.pending]
+        self.pending = None
+
+        while True:
+            try:
+                msg = self.q.get_nowait()
+            except Empty:
+                break
+            self.q.task_done()
+            if len('\n\n'.join(batch + [msg])) > MAX_LENGTH:
+                self.pending = msg
+                break
+            batch.append(msg)
+
+        self.send('\n\n'.join(batch))
+
+    def send(self, body):
+        """Send a message, retrying with exponential backoff.
+
+        Returns:
+            bool: True if the message was sent.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                self.transport.send(body)
+                return True
+            except Exception as e: # pylint: disable=broad-except
+                logging.warning('notification attempt %s failed: %s', attempt + 1, e)
+                if attempt < self.retries:
+                    self.clock.sleep(self.backoff * 2 ** attempt)
+        logging.error('notification dropped after %s attempts: %r', self.retries + 1, body)
+        return False
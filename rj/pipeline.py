@@ -0,0 +1,104 @@
+from queue import Queue, Full, Empty
+from threading import Thread, Event
+from time import monotonic
+import logging
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+COALESCE = 'coalesce'
+POLICIES = (BLOCK, DROP_OLDEST, COALESCE)
+
+class BoundedQueue(Queue):
+    """Queue with a policy for what producers do when consumers fall behind.
+
+    block: wait for room, up to timeout.
+    drop_oldest: make room by discarding the oldest item.
+    coalesce: discard everything still queued so consumers only see the latest item.
+    """
+    def __init__(self, maxsize, policy=BLOCK, name='queue'):
+        """
+        Args:
+            maxsize (int): Max number of queued items.
+            policy (str): block|drop_oldest|coalesce
+            name (str): Used in logs.
+        """
+        if policy not in POLICIES:
+            raise ValueError(policy)
+        super().__init__(maxsize)
+        self.policy = policy
+        self.name = name
+        self.dropped = 0
+
+    def put(self, item, block=True, timeout=None):
+        if self.policy == BLOCK:
+            super().put(item, block, timeout)
+            return
+
+        with self.mutex:
+            if self.policy == COALESCE:
+                stale = len(self.queue)
+            else:
+                stale = max(0, len(self.queue) - self.maxsize + 1) if self.maxsize > 0 else 0
+
+            for _ in range(stale):
+                logging.warning('%s full, dropped %r', self.name, self.queue.popleft())
+            self.dropped += stale
+            self.unfinished_tasks -= stale
+
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+
+class Worker(Thread):
+    """Thread that handles items from a queue until it's stopped and the queue is drained"""
+    def __init__(self, inq):
+        """
+        Args:
+            inq (Queue): Queue to consume from.
+        """
+        super().__init__(daemon=True)
+        self.inq = inq
+        self.stopping = Event()
+
+    def run(self):
+        while not (self.stopping.is_set() and self.inq.empty()):
+            try:
+                item = self.inq.get(timeout=0.1)
+            except Empty:
+                continue
+            try:
+                self.handle(item)
+            except Exception: # pylint: disable=broad-except
+                logging.exception('%s failed handling %r', type(self).__name__, item)
+            finally:
+                self.inq.task_done()
+
+    def handle(self, item):
+        raise NotImplementedError
+
+    def stop(self):
+        """Finish what's queued then exit."""
+        self.stopping.set()
+
+
+def shutdown(stages, timeout):
+    """Stop a pipeline upstream first so every stage drains before the next one stops.
+
+    Args:
+        stages (list(Thread)): Threads with a stop() method, in the order data flows through them.
+        timeout (float): Seconds for every stage to stop in. Stages still running
+            after that are abandoned, which is safe since they're daemons.
+
+    Returns:
+        bool: True if every stage stopped in time.
+    """
+    deadline = monotonic() + timeout
+    ok = True
+    for stage in stages:
+        stage.stop()
+        stage.join(max(0, deadline - monotonic()))
+        if stage.is_alive():
+            logging.warning('%s did not stop in time', type(stage).__name__)
+            ok = False
+    return ok
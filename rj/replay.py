@@ -0,0 +1,137 @@
+from bisect import bisect_right
+from datetime import timedelta
+from queue import Queue, Empty
+from .clock import VirtualClock
+from .models import Poller, Evaluator, Trader
+
+def synthetic_chain(last, now, days):
+    """Build an options() response around a price.
+
+    Strikes are within 10 of last and expirations are every weekday out to days.
+    Marks are intrinsic value plus a little time value so they're deterministic.
+
+    Args:
+        last (float): The underlying's price.
+        now (datetime.datetime): The current time.
+        days (int): How many days of expirations to include.
+
+    Returns:
+        dict
+    """
+    ret = {'putExpDateMap': {}, 'callExpDateMap': {}}
+    for dte in range(days + 1):
+        exp = now.date() + timedelta(days=dte)
+        if exp.weekday() > 4:
+            continue
+        key = f'{exp.isoformat()}:{dte}'
+        ret['putExpDateMap'][key] = {}
+        ret['callExpDateMap'][key] = {}
+        for strike in range(round(last) - 10, round(last) + 11):
+            time_value = 0.5 + 0.1 * dte
+            ret['putExpDateMap'][key][f'{strike}.0'] = [
+                {'strikePrice': float(strike), 'mark': round(max(strike - last, 0) + time_value, 2)}
+            ]
+            ret['callExpDateMap'][key][f'{strike}.0'] = [
+                {'strikePrice': float(strike), 'mark': round(max(last - strike, 0) + time_value, 2)}
+            ]
+    return ret
+
+
+class ReplayBroker():
+    """Stand in for spivey.Client that answers from recorded prices"""
+    def __init__(self, series, clock, chain=None):
+        """
+        Args:
+            series (list(tuple(datetime.datetime, float))): Recorded UTC times and prices, sorted by time.
+            clock (VirtualClock): The replay's clock.
+            chain (callable): Builds an options() response from (last, now, days).
+                Defaults to synthetic_chain.
+        """
+        self.times = [t for t, _ in series]
+        self.values = [float(v) for _, v in series]
+        self.clock = clock
+        self.chain = chain or synthetic_chain
+        self.orders = []
+
+    def underlying(self, ticker):
+        # pylint: disable=unused-argument
+        i = bisect_right(self.times, self.clock.now())
+        if i:
+            return self.values[i - 1]
+        return None
+
+    def options(self, ticker, days):
+        return self.chain(self.underlying(ticker), self.clock.now(), days)
+
+    @staticmethod
+    def to_full_symbol(ticker, exp, putCall, strike):
+        return f"{ticker}_{exp.replace('-', '')}{putCall[0].upper()}{strike:g}"
+
+    def buy_oco(self, capital, symbol, mark, limit, stop):
+        self.orders.append({
+            'time': self.clock.now(),
+            'symbol': symbol,
+            'capital': capital,
+            'mark': mark,
+            'limit': limit,
+            'stop': stop,
+        })
+
+
+class ReplayTrader(Trader):
+    """Trader that records notifications instead of sending them"""
+    def __init__(self, config, inq, client):
+        super().__init__(config, inq, client)
+        self.messages = []
+
+    def notify(self, msg):
+        self.messages.append(msg)
+
+
+def drain(q, fn):
+    """Call fn on everything in a queue until it's empty."""
+    while True:
+        try:
+            item = q.get_nowait()
+        except Empty:
+            return
+        fn(item)
+        q.task_done()
+
+def replay(config, series, chain=None):
+    """Replay recorded prices through Poller, Evaluator and Trader.
+
+    Time is virtual so a full day replays in milliseconds, and every stage runs
+    in lockstep on the calling thread so the output is deterministic.
+
+    Args:
+        config (dict): App settings like configure() returns. Trading is always
+            enabled since orders go to a stub broker.
+        series (list(tuple(datetime.datetime, float))): Recorded UTC times and prices, sorted by time.
+        chain (callable): Builds an options() response from (last, now, days).
+            Defaults to synthetic_chain.
+
+    Returns:
+        list(dict): Orders sent to the broker.
+    """
+    if not series:
+        return []
+
+    config = {**config, 'live_trading': 'ENABLED'}
+    clock = VirtualClock(series[0][0])
+    broker = ReplayBroker(series, clock, chain)
+    pointq = Queue()
+    orderq = Queue()
+
+    poller = Poller(config, pointq, broker, clock)
+    evaluator = Evaluator(config['points'], config['change'],
+            config['cooldown_points'], pointq, orderq)
+    trader = ReplayTrader(config, orderq, broker)
+
+    while clock.now() <= series[-1][0]:
+        poller.poll()
+        drain(pointq, lambda p: evaluator.eval(p.timestamp, p.value))
+        drain(orderq, trader.execute)
+        clock.sleep(config['polling_interval'])
+
+    return broker.orders
@@ -0,0 +1,112 @@
+from datetime import datetime as dt
+from datetime import timedelta, timezone
+import json
+import logging
+import os
+from influxdb_client import InfluxDBClient
+from .clock import SystemClock
+
+class Checkpoint():
+    """Class to save Evaluator state to a file so restarts can pick up where they left off"""
+    def __init__(self, path, clock=None):
+        """
+        Args:
+            path (str): JSON file to save to. It's replaced atomically on every save.
+            clock (SystemClock): Source of time. Defaults to the wall clock.
+        """
+        self.path = path
+        self.clock = clock or SystemClock()
+
+    def save(self, state):
+        """Save a snapshot along with when it was taken."""
+        tmp = f'{self.path}.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump({**state, 'saved': self.clock.now().isoformat()}, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            logging.exception('saving state failed')
+
+    def load(self):
+        """Load the last snapshot.
+
+        Returns:
+            dict, or None if nothing usable was saved.
+        """
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            state['saved'] = dt.fromisoformat(state['saved'])
+            return state
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError):
+            logging.exception('loading state failed')
+            return None
+
+
+def recent_points(config, count, clock=None):
+    """Fetch the ticker's most recent prices from influx at the polling interval.
+
+    Args:
+        config (dict): App settings.
+        count (int): Number of points to fetch.
+        clock (SystemClock): Source of time. Defaults to the wall clock.
+
+    Returns:
+        list(tuple(datetime.time, float)): UTC times and prices, oldest first.
+            Empty if influx isn't configured or can't be reached.
+    """
+    if not config['influxdb_url'] or not count:
+        return []
+
+    now = (clock or SystemClock()).now()
+    interval = config['polling_interval']
+    start = now - timedelta(seconds=interval * (count + 1))
+    query = f"""
+    from(bucket: "main")
+        |> range(start: {start.strftime('%Y-%m-%dT%H:%M:%SZ')}, stop: {now.strftime('%Y-%m-%dT%H:%M:%SZ')})
+        |> filter(fn: (r) => r["_measurement"] == "underlying")
+        |> filter(fn: (r) => r["symbol"] == "{config['ticker']}")
+        |> filter(fn: (r) => r["_field"] == "last")
+        |> aggregateWindow(every: {interval}s, fn: last, createEmpty: false)
+    """
+    try:
+        with InfluxDBClient(url=config['influxdb_url'], token=config['influxdb_token'], org="default") as client:
+            tables = client.query_api().query(query)
+    except Exception: # pylint: disable=broad-except
+        logging.exception('backfill query failed')
+        return []
+
+    points = [
+        (r.get_time().astimezone(timezone.utc).time(), float(r.get_value()))
+        for table in tables for r in table.records
+    ]
+    return points[-count:]
+
+def warm_start(evaluator, config, clock=None, fetch=recent_points):
+    """Restore an evaluator's state from its checkpoint and backfill anything missing.
+
+    Cooldowns are always restored, less the points missed while stopped, so a
+    restart never re-enters a trade. The window is only restored if it's no older
+    than state_max_age. Otherwise it's seeded from recent history.
+
+    Args:
+        evaluator (Evaluator|EvaluatorBank): Evaluator to warm up before it starts.
+        config (dict): App settings.
+        clock (SystemClock): Source of time. Defaults to the wall clock.
+        fetch (callable): Returns recent points given (config, count, clock).
+    """
+    clock = clock or SystemClock()
+    state = evaluator.checkpoint.load() if evaluator.checkpoint else None
+    if state:
+        elapsed = (clock.now() - state['saved']).total_seconds()
+        missed = max(0, int(elapsed // config['polling_interval']))
+        evaluator.restore(state, missed, elapsed <= config['state_max_age'])
+        logging.info('restored state saved %ss ago', round(elapsed))
+
+    if not evaluator.ready():
+        points = fetch(config, evaluator.size, clock)
+        if points:
+            evaluator.backfill(points)
+            logging.info('backfilled %s points', len(points))
@@ -1,13 +1,10 @@
 #!/usr/bin/env python3
 import argparse
-import os
 from statistics import mode
-from datetime import timedelta
-from datetime import datetime as dt
-from dotenv import load_dotenv
-from influxdb_client import InfluxDBClient
 import pandas as pd
 import utils
+from lib import session, sources
+from lib.cache import QueryCache
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Answer questions about timeseries data')
@@ -110,19 +107,10 @@ def find_high_low(df, high_holder, low_holder):
         None
     """
 
-    # Set DST offset
-    _date = df.iloc[-1]['_time'].date().strftime('%m-%d')
-    short_date = dt.strptime(_date, '%m-%d')
-
-    mar13 = dt.strptime('03-13', '%m-%d')
-    nov6 = dt.strptime('11-06', '%m-%d')
-
-    dst_offset = 4
-    if short_date < mar13 or short_date > nov6:
-        dst_offset = 5
-
-    high = df.loc[df['_value'] == df['_value'].max()].iloc[0]['_time'] - timedelta(hours=dst_offset)
-    low = df.loc[df['_value'] == df['_value'].min()].iloc[0]['_time'] - timedelta(hours=dst_offset)
+    times = session.to_local(df['_time'])
+    values = df['_value'].to_numpy()
+    high = times.iloc[values.argmax()]
+    low = times.iloc[values.argmin()]
 
     high_holder.append(high.strftime('%H'))
     low_holder.append(low.strftime('%H'))
@@ -130,41 +118,23 @@ def find_high_low(df, high_holder, low_holder):
 def main(days, start=None, verbose=False, excel=False):
     # pylint: disable=too-many-locals
     # Init shit
-    load_dotenv()
-    token = os.environ['INFLUXDB_TOKEN']
-    url = os.environ['INFLUXDB_URL']
-
-    # Create client
-    client = InfluxDBClient(url=url, token=token, org="default")
-    query_api = client.query_api()
-
-    timestamps = utils.timestamps_per_day(days, start)
+    cache = QueryCache(sources.connect())
 
     # Start the loop
     stats = []
     total_flips = []
     highs = []
     lows = []
-    for day in timestamps:
-        for key in day:
-            for times in day[key]: # One day per query
-                query = f"""
-                    from(bucket: "main")
-                        |> range(start: {times['start']}, stop: {times['stop']})
-                        |> filter(fn: (r) => r["_measurement"] == "underlying")
-                        |> filter(fn: (r) => r["symbol"] == "SPY")
-                        |> filter(fn: (r) => r["_field"] == "last")
-                        |> aggregateWindow(every: 1m, fn: mean, createEmpty: false)
-                 """
-
-                # Perform the query
-                df = query_api.query_data_frame(query)
-
-                # Calculate
-                if not df.empty:
-                    compute_stats(df, stats)
-                    find_when_price_changes_direction(df, total_flips, verbose=verbose)
-                    find_high_low(df, highs, lows)
+    sessions = session.sessions(days, start, trading=True)
+    data = cache.sessions('underlying', 'last', sessions, '1m', symbol='SPY')
+    for times in sessions:
+        df = data[times['date']]
+
+        # Calculate
+        if not df.empty:
+            compute_stats(df, stats)
+            find_when_price_changes_direction(df, total_flips, verbose=verbose)
+            find_high_low(df, highs, lows)
 
     ### Output
     # Stats
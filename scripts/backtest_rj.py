@@ -2,17 +2,13 @@
 import os
 import sys
 import argparse
-from time import sleep
-from queue import Queue
-from datetime import datetime as dt
-import numpy as np
-from dotenv import load_dotenv
-from influxdb_client import InfluxDBClient
-import utils
+from lib import session, sources
+from lib.cache import QueryCache
 
 sys.path.insert(1, os.path.join(sys.path[0], '..'))
 # pylint: disable=import-error, wrong-import-position
-from rj.models import Evaluator, Point
+from rj.models import Evaluator
+from rj.replay import replay
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Backtest rj')
@@ -21,32 +17,42 @@ def parse_arguments():
     parser.add_argument('-p', '--points', help='points', type=int, required=True)
     parser.add_argument('--change', help='change', type=float, required=True)
     parser.add_argument('-v', '--verbose', help='enable verbose logging', action='store_true', default=True)
+    parser.add_argument('-r', '--replay', help='replay through the live pipeline', action='store_true')
     return parser.parse_args()
 
 def main(start, _cooldown_limit, points, change):
-    pointq = Queue()
-    orderq = Queue()
-
     df = get_spy_timeseries_data(start)
+    times = session.to_local(df['_time']).dt.time
 
-    #for i in np.arange(0.1, 10.1, .1):
-    #    pointq.put(Point(dt.now().time(), i))
-    for i in df.itertuples():
-        pointq.put(Point(utils.to_dst(i[5]).time(), i[6]))
-
-    e = TestEvaluator(points, change, pointq, orderq, _cooldown_limit)
-    # pylint: disable=attribute-defined-outside-init
-    e.daemon = True
-    e.start()
+    # Evaluate in lockstep so every point is processed before exiting
+    e = TestEvaluator(points, change, None, None, _cooldown_limit)
+    for time, value in zip(times, df['_value']):
+        e.eval(time, value)
 
-    while True:
-        if pointq.qsize() == 0:
-            sleep(0.5)
-            sys.exit(0)
+def replay_main(start, _cooldown_limit, points, change):
+    """Replay the day through the live Poller, Evaluator and Trader against a stub broker."""
+    df = get_spy_timeseries_data(start)
+    series = list(zip(df['_time'].dt.tz_convert('UTC').dt.tz_localize(None), df['_value']))
+
+    config = {
+        'capital': 1000,
+        'days': 14,
+        'dte_min': 1,
+        'dte_max': 4,
+        'ticker': 'SPY',
+        'points': points,
+        'change': change,
+        'bracket': 0.2,
+        'polling_interval': 30,
+        'cooldown_points': _cooldown_limit,
+    }
+    for order in replay(config, series):
+        print(f"{session.to_local([order['time']])[0].time()} {order['symbol']} "
+              f"mark={order['mark']}, limit={order['limit']}, stop={order['stop']}")
 
 class TestEvaluator(Evaluator):
     def __init__(self, max_points, change, inq, outq, cooldown_limit):
-        super().__init__(max_points, change, inq, outq)
+        super().__init__(max_points, change, cooldown_limit, inq, outq)
         self.cooldown_limit = cooldown_limit
         self._cooldown = False
         self.iterations = 0
@@ -86,29 +92,15 @@ class TestEvaluator(Evaluator):
                 self._cooldown = True
 
 def get_spy_timeseries_data(start):
-    load_dotenv()
-    token = os.environ['INFLUXDB_TOKEN']
-    url = os.environ['INFLUXDB_URL']
-
-    client = InfluxDBClient(url=url, token=token, org="default")
-    query_api = client.query_api()
-
-    timestamps = utils.timestamps_per_day(1, start)
+    cache = QueryCache(sources.connect())
 
-    for day in timestamps:
-        for key in day:
-            for times in day[key]: # One day per iteration
-                query = f"""
-                    from(bucket: "main")
-                        |> range(start: {times['start']}, stop: {times['stop']})
-                        |> filter(fn: (r) => r._measurement == "underlying")
-                        |> filter(fn: (r) => r.symbol == "SPY")
-                        |> filter(fn: (r) => r._field == "last")
-                        |> aggregateWindow(every: 30s, fn: mean, createEmpty: false)
-                 """
-                return query_api.query_data_frame(query)
+    times = session.sessions(1, start)[0]
+    return cache.query('underlying', 'last', times['start'], times['stop'], '30s', symbol='SPY')
 
 
 if __name__ == '__main__':
     args = parse_arguments()
-    main(args.start, args.cooldown, args.points, args.change)
+    if args.replay:
+        replay_main(args.start, args.cooldown, args.points, args.change)
+    else:
+        main(args.start, args.cooldown, args.points, args.change)
@@ -15,7 +15,8 @@ def parse_arguments():
     return parser.parse_args()
 
 def main(start, exp, strike, putCall, limit, stop, time, verbose=False):
-    ts = backtest.query_timeseries(start, exp, strike, putCall)
+    # Stream since a single evaluation usually stops well before the close
+    ts = backtest.stream_timeseries(start, exp, strike, putCall)
     backtest.main(ts, limit, stop, time, verbose)
 
 
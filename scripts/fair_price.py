@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
 import argparse
+import json
 import os
 from datetime import datetime as dt
 from datetime import timedelta
 from dateutil.parser import parse
-from dotenv import load_dotenv
-from influxdb_client import InfluxDBClient
+import pandas as pd
+from lib import session, sources
+from lib.cache import QueryCache
+from lib.contracts import ContractIndex
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Determine the fair price for a VIX contract')
@@ -18,89 +21,111 @@ def parse_arguments():
     parser.add_argument('--verbose', help='enable verbose logging', action='store_true')
     return parser.parse_args()
 
-def query_vix(client, lookback):
-    query_api = client.query_api()
-    df = query_api.query_data_frame(
-        f"""
-            from(bucket: "main")
-                |> range(start: {dt.isoformat(lookback.replace(hour=13, minute=30, second=0, microsecond=0))}Z,
-                    stop: {dt.isoformat(lookback.replace(hour=20, minute=00, second=0, microsecond=0))}Z)
-                |> filter(fn: (r) => r["_measurement"] == "underlying")
-                |> filter(fn: (r) => r["symbol"] == "$VIX.X")
-                |> filter(fn: (r) => r["_field"] == "last")
-                |> aggregateWindow(every: 24h, fn: mean, createEmpty: false)
-        """
-    )
+VIX = '$VIX.X'
 
-    v = 0
-    if not df.empty:
-        v = round(df['_value'][0], 2)
-    return v
-
-def get_current_vix(client):
-    last_week = dt.now() - timedelta(days=5)
-    query_api = client.query_api()
-    df = query_api.query_data_frame(
-        f"""
-            from(bucket: "main")
-                |> range(start: {dt.isoformat(last_week)}Z,
-                    stop: {dt.isoformat(dt.now())}Z)
-                |> filter(fn: (r) => r["_measurement"] == "underlying")
-                |> filter(fn: (r) => r["symbol"] == "$VIX.X")
-                |> filter(fn: (r) => r["_field"] == "last")
-                |> aggregateWindow(every: 30m, fn: mean, createEmpty: false)
-                |> last()
-        """
-    )
+def query_batch(source, lookups):
+    """Run lookups in one query.
 
-    v = 0
+    Returns:
+        dict(str: dict(str: float)) of rounded values by row and then column.
+        Missing values are 0.
+    """
+    if not lookups:
+        return {}
+    df = source.batch(lookups)
+    found = {}
     if not df.empty:
-        v = round(df['_value'][0], 2)
-    return v
-
-def query_mark(client, lookback, exp, putCall, strike):
-    query_api = client.query_api()
-    df = query_api.query_data_frame(
-        f"""
-            from(bucket: "main")
-                |> range(start: {dt.isoformat(lookback.replace(hour=13, minute=30, second=0, microsecond=0))}Z,
-                    stop: {dt.isoformat(lookback.replace(hour=20, minute=00, second=0, microsecond=0))}Z)
-                |> filter(fn: (r) => r["_measurement"] == "options")
-                |> filter(fn: (r) => r["_field"] == "mark")
-                |> filter(fn: (r) => r["putCall"] == "{putCall}")
-                |> filter(fn: (r) => r["exp"] == "{exp}")
-                |> filter(fn: (r) => r["strike"] == "{strike}")
-                |> aggregateWindow(every: 24h, fn: mean, createEmpty: false)
-        """
-    )
+        found = df.set_index('row').to_dict('index')
 
-    m = 0
-    if not df.empty:
-        m = round(df['_value'][0], 2)
-    return m
-
-def get_current_mark(client, exp, putCall, strike):
-    last_week = dt.now() - timedelta(days=5)
-    query_api = client.query_api()
-    df = query_api.query_data_frame(
-        f"""
-            from(bucket: "main")
-                |> range(start: {dt.isoformat(last_week)}Z,
-                    stop: {dt.isoformat(dt.now())}Z)
-                |> filter(fn: (r) => r["_measurement"] == "options")
-                |> filter(fn: (r) => r["_field"] == "mark")
-                |> filter(fn: (r) => r["putCall"] == "{putCall}")
-                |> filter(fn: (r) => r["exp"] == "{exp}")
-                |> filter(fn: (r) => r["strike"] == "{strike}")
-                |> aggregateWindow(every: 30m, fn: mean, createEmpty: false)
-                |> last()
-        """
-    )
+    ret = {}
+    for row, columns in lookups.items():
+        values = found.get(row, {})
+        ret[row] = {c: round(values[c], 2) if pd.notna(values.get(c)) else 0 for c in columns}
+    return ret
 
-    m = 0
-    if not df.empty:
-        m = round(df['_value'][0], 2)
-    return m
+class History:
+    """Historical vix and marks memoized per (symbol, date).
+
+    Past sessions never change so values are kept on disk next to the query
+    cache and only the ones missing are queried, all at once.
+    """
+    def __init__(self, source, path=None):
+        """
+        Args:
+            source (InfluxSource|LocalSource): Where to query.
+            path (str): File to memoize values in. Defaults to fair_price.json in the query cache.
+        """
+        self.source = source
+        self.path = path or os.path.join(QueryCache(source).path, 'fair_price.json')
+        self.memo = {}
+        self.recent = {} # Sessions that haven't closed yet so can't be saved
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.memo = json.load(f)
+
+    @staticmethod
+    def key(symbol, date):
+        return f'{symbol}|{date.isoformat()}'
+
+    def fetch(self, wanted, current=None):
+        """Fetch historical values plus the current ones in a single query.
+
+        Args:
+            wanted (list(tuple(str, datetime.date, dict))): symbol, session date
+                and the tags to filter the options measurement on. Tags are
+                None for the vix. Contracts use exp|putCall|strike as their symbol.
+            current (dict(str: dict)): Lookups for current values by name. Never memoized.
+
+        Returns:
+            dict(str: float): current values by name.
+        """
+        lookups = {}
+        for symbol, date, tags in wanted:
+            key = self.key(symbol, date)
+            if key in self.memo or key in self.recent or key in lookups:
+                continue
+            times = session.session(date)
+            if tags is None:
+                table = sources.lookup('underlying', 'last', times['start'], times['stop'], '24h', 'first',
+                    symbol=symbol)
+            else:
+                table = sources.lookup('options', 'mark', times['start'], times['stop'], '24h', 'first', **tags)
+            lookups[key] = {'value': table}
+        if current:
+            lookups['current'] = current
+
+        res = query_batch(self.source, lookups)
+        ret = res.pop('current', {})
+        for key, value in res.items():
+            if QueryCache.closed(session.session(dt.fromisoformat(key.rsplit('|', 1)[1]).date())['stop']):
+                self.memo[key] = value['value']
+            else:
+                self.recent[key] = value['value']
+        if res:
+            self.save()
+        return ret
+
+    def get(self, symbol, date):
+        key = self.key(symbol, date)
+        return self.memo.get(key, self.recent.get(key, 0))
+
+    def save(self):
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.memo, f)
+        os.replace(tmp, self.path)
+
+def current_vix():
+    """Lookup for the latest vix."""
+    now = dt.now()
+    return sources.lookup('underlying', 'last', f'{dt.isoformat(now - timedelta(days=5))}Z', f'{dt.isoformat(now)}Z',
+        '30m', 'last', symbol=VIX)
+
+def current_mark(exp, putCall, strike):
+    """Lookup for a contract's latest mark."""
+    now = dt.now()
+    return sources.lookup('options', 'mark', f'{dt.isoformat(now - timedelta(days=5))}Z', f'{dt.isoformat(now)}Z',
+        '30m', 'last', putCall=putCall, exp=exp, strike=strike)
 
 def to_ttl(exp, start=None):
     """Return the number of days until a date is reached.
@@ -159,23 +184,14 @@ def main(exp, putCall, strike, vix, mark, start, verbose=False):
     """
     The algorithm is:
     1. Find how many days until the contract expiress, this is the ttl.
-    2. For each expiration we know about:
+    2. For each expiration of the strike that was trading at the ttl:
         1. Convert the exp to a timestamp.
         2. Calculate the date to match the input's ttl.
         2. Look back at the ttl date.
         3. Record the mark and the vix.
     """
-    load_dotenv()
-    token = os.environ['INFLUXDB_TOKEN']
-    url = os.environ['INFLUXDB_URL']
-
-    client = InfluxDBClient(url=url, token=token, org="default")
-
-    if not vix:
-        vix = get_current_vix(client)
-
-    if not mark:
-        mark = get_current_mark(client, exp, putCall, strike)
+    source = sources.connect()
+    history = History(source)
 
     # Find the exp's ttl.
     _start = None
@@ -183,16 +199,33 @@ def main(exp, putCall, strike, vix, mark, start, verbose=False):
         _start = parse(start)
     ttl = to_ttl(exp.strip(), _start)
 
+    # Compare against every expiration of this strike that was trading at the same ttl
+    index = ContractIndex(source)
+    index.refresh()
+    historical_exps = index.expirations(putCall, strike, ttl, (_start or dt.now()).date())
+    lookbacks = {_exp: (dt.strptime(_exp, '%d %b %y') - ttl).date() for _exp in historical_exps}
+
+    # Everything, including the current vix and mark, comes back from one query
+    wanted = []
+    for _exp, date in lookbacks.items():
+        wanted.append((VIX, date, None))
+        wanted.append((f'{_exp}|{putCall}|{strike}', date, {'putCall': putCall, 'exp': _exp, 'strike': strike}))
+    current = {}
+    if not vix:
+        current['vix'] = current_vix()
+    if not mark:
+        current['mark'] = current_mark(exp, putCall, strike)
+    res = history.fetch(wanted, current)
+    vix = vix or res.get('vix', 0)
+    mark = mark or res.get('mark', 0)
+
     print(f'[*] {exp} expires in {ttl.days} days')
     print(f'[*] Searching for {putCall}s @ {strike} with a {ttl.days} day ttl')
     print( '    exp\t\tvix\tmark\tvmr\tmoneyness')
 
-    historical_exps = ['16 FEB 22', '15 MAR 22', '20 APR 22']
-    for _exp in historical_exps:
-        lookback = dt.strptime(_exp, '%d %b %y') - ttl
-
-        _vix = query_vix(client, lookback)
-        _mark = query_mark(client, lookback, _exp, putCall, strike)
+    for _exp, date in lookbacks.items():
+        _vix = history.get(VIX, date)
+        _mark = history.get(f'{_exp}|{putCall}|{strike}', date)
         print(f'    {_exp}\t{_vix}\t{_mark}\t{to_vmr(_vix, _mark)}\t{moneyness(putCall, _vix, strike)}')
 
     print(f'\n    {exp}\t{vix}\t{mark}\t{to_vmr(vix, mark)}\t{moneyness(putCall, vix, strike)}')
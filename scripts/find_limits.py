@@ -1,10 +1,10 @@
 #!/usr/bin/env python3
 import os
 import argparse
-import utils
 import pandas as pd
 import numpy as np
 from lib import backtest
+from lib import session
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Find the highest performing bracket for SPY options')
@@ -16,20 +16,36 @@ def parse_arguments():
     return parser.parse_args()
 
 
-def main(start, exp, strike, putCall, verbose=False):
+def sweep(ts, verbose=False, progress=True):
+    """Evaluate every bracket from every start minute of the day.
+
+    Args:
+        ts (dataframe): 1 day's worth of a contract's marks.
+        verbose (boolean): Flag to control logging.
+        progress (boolean): Flag to print each bracket as it's processed.
+
+    Returns:
+        list(dict): One row of results per bracket.
+    """
     total = []
-    ts = backtest.query_timeseries(start, exp, strike, putCall)
+
+    # Index the day once and reuse it for every bracket and start minute
+    index = backtest.FirstPassageIndex(ts)
+    minutes = session.grid()
 
     for _limit in np.arange(0.05, 1.05, 0.05):
         limit = round(_limit, 2)
         day_by_min = []
-        print(f'[*] processing {limit}')
+        if progress:
+            print(f'[*] processing {limit}')
 
         # start from every minute in the day
-        for m in utils.timestamps_one_day_by_minute():
-            day_by_min.append(backtest.main(ts, limit, limit * -1, m, verbose))
+        for m in minutes:
+            day_by_min.append(backtest.main(index, limit, limit * -1, m, verbose))
 
         res = pd.DataFrame(list(filter(None, day_by_min)))
+        if res.empty:
+            continue
 
         total.append({
             'limit': res['limit'][0],
@@ -41,6 +57,11 @@ def main(start, exp, strike, putCall, verbose=False):
             'stops': len(res.query('result == "stop"')),
             'runaways': len(res.query('result == "runaway"')),
         })
+    return total
+
+def main(start, exp, strike, putCall, verbose=False):
+    ts = backtest.query_timeseries(start, exp, strike, putCall)
+    total = sweep(ts, verbose)
     print('[*] done')
     filename = f"{exp.replace(' ', '')}_{strike}_{putCall}.xlsx"
     pd.DataFrame(total).to_excel(filename)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+import os
+import argparse
+import itertools
+from multiprocessing import Pool
+import pandas as pd
+from lib import backtest
+import find_limits
+import utils
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Find the highest performing brackets across many SPY options')
+    parser.add_argument('--start', help='day to start with', required=True)
+    parser.add_argument('-e', '--exps', help='comma separated expirations, e.g. "16 MAY 22,18 MAY 22"', required=True)
+    parser.add_argument('-s', '--strikes', help='strikes as a list (410,415) or range (400:420:5)', required=True)
+    parser.add_argument('-t', '--type', help='put, call or both', default='put,call')
+    parser.add_argument('-w', '--workers', help='worker processes', type=int, default=os.cpu_count())
+    parser.add_argument('-o', '--output', help='parquet file to write results to', default='limits.parquet')
+    return parser.parse_args()
+
+def part(parts, contract):
+    """Generate the file a contract's results are saved in while the sweep runs."""
+    exp, strike, putCall = contract
+    return os.path.join(parts, f"{exp.replace(' ', '')}_{strike}_{putCall}.parquet")
+
+def evaluate(params):
+    """Sweep every bracket for one contract and save the results.
+
+    Args:
+        params (tuple): contract, its marks and the file to save to.
+
+    Returns:
+        tuple: contract
+    """
+    contract, ts, filename = params
+    exp, strike, putCall = contract
+    res = pd.DataFrame(find_limits.sweep(ts, progress=False))
+    res.insert(0, 'putCall', putCall)
+    res.insert(0, 'strike', strike)
+    res.insert(0, 'exp', exp)
+
+    tmp = f'{filename}.tmp'
+    res.to_parquet(tmp)
+    os.replace(tmp, filename)
+    return contract
+
+def main(start, exps, strikes, putCalls, workers=None, output='limits.parquet'):
+    # pylint: disable=too-many-arguments
+    # Finished contracts are kept next to the output so an interrupted run picks up where it left off
+    parts = f'{output}.parts'
+    os.makedirs(parts, exist_ok=True)
+
+    contracts = list(itertools.product(exps, strikes, putCalls))
+    todo = [c for c in contracts if not os.path.exists(part(parts, c))]
+    print(f'[*] {len(contracts) - len(todo)}/{len(contracts)} contracts already done')
+
+    if todo:
+        series = backtest.query_contracts(
+            start,
+            sorted({c[0] for c in todo}),
+            sorted({c[1] for c in todo}),
+            sorted({c[2] for c in todo}),
+        )
+        work = [(c, series[c], part(parts, c)) for c in todo if c in series]
+        for c in todo:
+            if c not in series:
+                print(f'[!] no marks for {c}')
+
+        done = len(contracts) - len(todo)
+        with Pool(workers) as pool:
+            for contract in pool.imap_unordered(evaluate, work):
+                done += 1
+                print(f'[*] {done}/{len(contracts)} contracts done {contract}')
+
+    files = [part(parts, c) for c in contracts if os.path.exists(part(parts, c))]
+    if not files:
+        print('[!] no results')
+        return
+    res = pd.concat([pd.read_parquet(f) for f in files], ignore_index=True)
+    res.to_parquet(output)
+    print(f'[*] wrote {len(res)} rows to {output}')
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    main(
+        args.start,
+        [e.strip() for e in args.exps.split(',')],
+        utils.parse_grid(args.strikes, int),
+        [t.strip() for t in args.type.split(',')],
+        args.workers,
+        args.output,
+    )
@@ -1,78 +1,197 @@
 #!/usr/bin/env python3 -u
+import os
 import argparse
 from datetime import datetime as dt
 from dotenv import load_dotenv
 from dateutil.parser import parse as date_parse
 from time import sleep
+import numpy as np
 import spivey
 
+# Max put/call mark delta to report per ticker. Override with
+# $STRADDLE_THRESHOLDS or --threshold.
+THRESHOLDS = {
+    'AMZN': 10,
+    'FB': 1,
+    'TSLA': 1,
+    'SPOT': 1,
+    'GOOG': 1,
+    'NFLX': 1,
+    'SHOP': 1,
+    'PTON': 1,
+    'NVDA': 0.5,
+    'MSFT': 1,
+    'AAPL': 1,
+    'V': 1,
+    'XOM': 1,
+    'SNAP': 1,
+    'SNOW': 1,
+}
+
+CHAIN = np.dtype([
+    ('exp', 'U9'),
+    ('strike', 'f8'),
+    ('put', 'f8'),
+    ('call', 'f8'),
+    ('volume', 'i8'),
+])
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Poll live options contracts looking for puts and calls around the same price')
     parser.add_argument('-t', '--ticker', help='ticker', required=True)
     parser.add_argument('-v', '--verbose', help='enable verbose logging', action='store_true')
     parser.add_argument('-n', '--notify', help='notify datadog on findings', action='store_true')
     parser.add_argument('-e', '--exp', help='specific expiration to search for', default='')
+    parser.add_argument('--threshold', help="max delta between the put and call's marks", type=float)
+    parser.add_argument('--tolerance', help='report matches whose marks moved more than this', type=float, default=0.05)
     return parser.parse_args()
 
-def notify(msg, ticker, exp, strike):
-    pass
+def parse_thresholds(value):
+    """Parse per ticker thresholds in the format TICKER=delta,...
 
-def main(ticker, client, _notify, _exp, verbose):
-    load_dotenv()
-    options = client.options(ticker, 45)
+    Returns:
+        dict(str: float)
+    """
+    ret = {}
+    for item in filter(None, (i.strip() for i in value.split(','))):
+        ticker, delta = item.split('=')
+        ret[ticker.strip().upper()] = float(delta)
+    return ret
+
+def thresholds():
+    """Merge the default thresholds with $STRADDLE_THRESHOLDS."""
+    return {**THRESHOLDS, **parse_thresholds(os.getenv('STRADDLE_THRESHOLDS', ''))}
+
+def to_array(options):
+    """Flatten an options() response into one row per strike with both marks.
+
+    Args:
+        options (dict): The response from spivey.Client.options().
+
+    Returns:
+        ndarray with the CHAIN dtype.
+    """
     calls = options['callExpDateMap']
     puts = options['putExpDateMap']
-
-    thresholds = {
-        'AMZN': 10,
-        'FB': 1,
-        'TSLA': 1,
-        'SPOT': 1,
-        'GOOG': 1,
-        'NFLX': 1,
-        'SHOP': 1,
-        'PTON': 1,
-        'NVDA': 0.5,
-        'MSFT': 1,
-        'AAPL': 1,
-        'V': 1,
-        'XOM': 1,
-        'SNAP': 1,
-        'SNOW': 1,
-    }
-
-    # pylint: disable=too-many-nested-blocks
+    rows = []
     for i in puts:
-        exp = dt.strftime(date_parse(i.split(':')[0]),'%d %b %y').upper()
-        if _exp:
-            # Used an if not to avoid yet another nested block.
-            if not _exp in exp:
-                continue
-        if verbose:
-            print(f"[*] working through {exp}")
+        exp = dt.strftime(date_parse(i.split(':')[0]), '%d %b %y').upper()
         for j in puts[i]:
+            if j not in calls.get(i, {}):
+                continue
+            call = calls[i][j][0]['mark']
             for k in puts[i][j]:
-                if k['mark'] > 0 and calls[i][j][0]['mark'] > 0:
-                    delta = round(abs(k['mark'] - calls[i][j][0]['mark']), 2)
-                    if verbose:
-                        print(' ', 'put', k['strikePrice'], k['mark'])
-                        print(' ', 'call', calls[i][j][0]['strikePrice'], calls[i][j][0]['mark'])
-                        print(' ', 'delta', delta)
-                    if delta <= thresholds[ticker]:
-                        msg = f"{ticker} {exp} @ {k['strikePrice']} - mark={k['mark']} vol={k['totalVolume']} delta={delta}"
-                        print(msg)
-                        if _notify:
-                            notify(msg, ticker, exp, k['strikePrice'])
-    print('')
+                rows.append((exp, k['strikePrice'], k['mark'], call, k['totalVolume']))
+    return np.array(rows, dtype=CHAIN)
+
+def scan(chain, threshold, _exp=''):
+    """Find strikes where the put and call are around the same price.
+
+    Args:
+        chain (ndarray): Rows with the CHAIN dtype.
+        threshold (float): Max delta between the put and call's marks.
+        _exp (str): Only search expirations containing this.
+
+    Returns:
+        tuple(ndarray, ndarray): Matching rows and their deltas, sorted by delta.
+    """
+    delta = np.round(np.abs(chain['put'] - chain['call']), 2)
+    hit = (chain['put'] > 0) & (chain['call'] > 0) & (delta <= threshold)
+    if _exp:
+        hit &= np.char.find(chain['exp'], _exp) >= 0
+
+    order = np.argsort(delta[hit], kind='stable')
+    return chain[hit][order], delta[hit][order]
+
+def keys(chain):
+    """Identify each row by its expiration and strike."""
+    return np.char.add(np.char.add(chain['exp'], ' @ '), chain['strike'].astype(str))
+
+def diff(prev, curr, tolerance):
+    """Compare two polls' matches.
+
+    Args:
+        prev (ndarray): The last poll's matches.
+        curr (ndarray): This poll's matches.
+        tolerance (float): How far a mark has to move to be reported.
+
+    Returns:
+        tuple(ndarray, ndarray, ndarray): Rows that started matching, stopped
+            matching and matched both times but whose put or call mark moved
+            more than tolerance.
+    """
+    prev_keys = keys(prev)
+    curr_keys = keys(curr)
+    new = curr[~np.isin(curr_keys, prev_keys)]
+    gone = prev[~np.isin(prev_keys, curr_keys)]
+
+    _, p, c = np.intersect1d(prev_keys, curr_keys, return_indices=True)
+    moved = (np.abs(prev['put'][p] - curr['put'][c]) > tolerance) | \
+        (np.abs(prev['call'][p] - curr['call'][c]) > tolerance)
+    return new, gone, curr[np.sort(c[moved])]
+
+def message(ticker, row):
+    delta = np.round(abs(row['put'] - row['call']), 2)
+    return f"{ticker} {row['exp']} @ {row['strike']} - mark={row['put']} vol={row['volume']} delta={delta}"
+
+def notify(msg, ticker, exp, strike):
+    pass
+
+def main(ticker, client, _notify, _exp, verbose, threshold, prev=None, tolerance=0.05):
+    """Poll once and report what changed since the last poll.
+
+    Only transitions are notified on: strikes that start or stop matching.
+
+    Args:
+        prev (ndarray): The last poll's matches. Everything is new if not set.
+        tolerance (float): How far a mark has to move to be reported.
+
+    Returns:
+        ndarray: This poll's matches to pass to the next poll.
+    """
+    # pylint: disable=too-many-arguments
+    load_dotenv()
+    chain = to_array(client.options(ticker, 45))
+
+    if verbose:
+        for exp in dict.fromkeys(chain['exp']):
+            print(f"[*] working through {exp}")
+        print(f'[*] {len(chain)} strikes')
+
+    matches, _ = scan(chain, threshold, _exp)
+    if prev is None:
+        prev = np.array([], dtype=CHAIN)
+    new, gone, moved = diff(prev, matches, tolerance)
+
+    for row in new:
+        msg = message(ticker, row)
+        print(f'+ {msg}')
+        if _notify:
+            notify(msg, ticker, row['exp'], row['strike'])
+    for row in gone:
+        msg = message(ticker, row)
+        print(f'- {msg}')
+        if _notify:
+            notify(f'gone {msg}', ticker, row['exp'], row['strike'])
+    for row in moved:
+        print(f'~ {message(ticker, row)}')
+    if len(new) or len(gone) or len(moved):
+        print('')
+    return matches
 
 
 if __name__ == '__main__':
     print(f"Started {__file__.rsplit('/', maxsplit=1)[-1]}")
     args = parse_arguments()
+    t = args.threshold
+    if t is None:
+        t = thresholds()[args.ticker.upper()]
     c = spivey.Client()
+    last = None
     try:
         while True:
-            main(args.ticker.upper(), c, args.notify, args.exp.upper(), args.verbose)
+            last = main(args.ticker.upper(), c, args.notify, args.exp.upper(), args.verbose, t,
+                last, args.tolerance)
             sleep(30)
     except KeyboardInterrupt:
         pass
@@ -1,47 +1,185 @@
-import os
-from dotenv import load_dotenv
-from influxdb_client import InfluxDBClient
+import datetime
+from bisect import bisect_left
 from dateutil.parser import parse
-import utils
+import numpy as np
+import pandas as pd
+from lib import session
+from lib import sources
+from lib.cache import QueryCache
 
 def query_timeseries(start, exp, strike, putCall):
-    load_dotenv()
-    token = os.environ['INFLUXDB_TOKEN']
-    url = os.environ['INFLUXDB_URL']
-
-    client = InfluxDBClient(url=url, token=token, org="default")
-    query_api = client.query_api()
-
-    timestamps = utils.timestamps_per_day(1, start)
-
-    for day in timestamps:
-        for key in day:
-            for times in day[key]: # One day per iteration
-                query = f"""
-                    from(bucket: "main")
-                        |> range(start: {times['start']}, stop: {times['stop']})
-                        |> filter(fn: (r) => r._measurement == "options")
-                        |> filter(fn: (r) => r.symbol == "SPY")
-                        |> filter(fn: (r) => r.exp == "{exp}")
-                        |> filter(fn: (r) => r.strike == "{strike}.0")
-                        |> filter(fn: (r) => r.putCall == "{putCall}")
-                        |> filter(fn: (r) => r._field == "mark")
-                        |> aggregateWindow(every: 30s, fn: mean, createEmpty: false)
-                 """
-                return query_api.query_data_frame(query)
+    cache = QueryCache(sources.connect())
+
+    times = session.sessions(1, start)[0]
+    return cache.query('options', 'mark', times['start'], times['stop'], '30s',
+        symbol='SPY', exp=exp, strike=f'{strike}.0', putCall=putCall)
+
+
+def query_contracts(start, exps, strikes, putCalls):
+    """Query many contracts' marks for a day with one query.
+
+    Args:
+        start (str): The day to query.
+        exps (list(str)): Expirations, e.g. 16 MAY 22.
+        strikes (list(int)): Strikes.
+        putCalls (list(str)): put and/or call.
+
+    Returns:
+        dict((exp, strike, putCall): dataframe) with _time and _value columns.
+        Contracts without data are left out.
+    """
+    source = sources.connect()
+    times = session.sessions(1, start)[0]
+    df = sources.frame(source.query('options', 'mark', times['start'], times['stop'], '30s',
+        symbol='SPY', exp=list(exps), strike=[f'{s}.0' for s in strikes], putCall=list(putCalls)))
+    source.close()
+
+    if df.empty:
+        return {}
+
+    ret = {}
+    for (exp, strike, putCall), g in df.groupby(['exp', 'strike', 'putCall']):
+        key = (exp, int(float(strike)), putCall)
+        ret[key] = g[['_time', '_value']].sort_values('_time').reset_index(drop=True)
+    return ret
+
+
+def stream_timeseries(start, exp, strike, putCall, every='30s'):
+    """Stream a contract's marks for a day without loading them all.
+
+    Args:
+        every (str): The aggregation window. Raw points are streamed if not set.
+
+    Yields:
+        tuple(datetime.datetime, float): UTC time and mark.
+    """
+    source = sources.connect()
+    times = session.sessions(1, start)[0]
+    try:
+        yield from source.stream('options', 'mark', times['start'], times['stop'], every,
+            symbol='SPY', exp=exp, strike=f'{strike}.0', putCall=putCall)
+    finally:
+        source.close()
 
 
 def main(df, limit, stop, time, verbose=False):
     b = BacktestWindow(limit, stop, time, verbose)
     return b.eval(df)
 
+POWER_HOUR = parse('14:59:00').time()
+MORNING = parse('09:59:00').time()
+
+class FirstPassageIndex:
+    """Precomputed index over one day of marks.
+
+    Answers "when does the change from a start time first reach the limit or
+    the stop" in O(log n) per query so brackets can be swept without
+    re-scanning the day.
+    """
+    def __init__(self, df):
+        """
+        Args:
+            df (dataframe): Timeseries data
+        """
+        values = df['_value'].to_numpy(dtype=float)
+        self.times = session.to_local(df['_time']).dt.time.tolist()
+        self.nonzero = np.flatnonzero(values != 0).tolist()
+        self.closes = [i for i, t in enumerate(self.times) if t == session.CLOSE]
+
+        # Python floats keep the change math identical to iterating the dataframe
+        self.highs = [level.tolist() for level in self.sparse_table(values, np.fmax)]
+        self.lows = [level.tolist() for level in self.sparse_table(values, np.fmin)]
+        self.values = self.highs[0]
+
+    def __len__(self):
+        return len(self.values)
+
+    @staticmethod
+    def sparse_table(values, fn):
+        """Build a sparse table where level k holds fn over windows of 2**k values.
+
+        Args:
+            values (ndarray): Values to index.
+            fn (ufunc): np.fmax or np.fmin. NaNs are ignored like they are in eval().
+
+        Returns:
+            list(ndarray)
+        """
+        table = [values]
+        width = 1
+        while width * 2 <= len(values):
+            prev = table[-1]
+            table.append(fn(prev[:-width], prev[width:]))
+            width *= 2
+        return table
+
+    @staticmethod
+    def first(table, begin, end, hit):
+        """Find the first position in [begin, end) whose value satisfies hit.
+
+        hit must be monotonic in the value, so testing the max (or min) of a
+        window tells whether any value in that window satisfies it.
+
+        Returns:
+            int: The position, or end if no value satisfies hit.
+        """
+        pos = begin
+        for k in range(len(table) - 1, -1, -1):
+            width = 1 << k
+            if pos + width <= end and not hit(table[k][pos]):
+                pos += width
+        return pos
+
+    def start(self, start_time):
+        """Find the position of the starting value for start_time.
+
+        Returns:
+            int: The position, or len(self) if there isn't one.
+        """
+        i = bisect_left(self.nonzero, bisect_left(self.times, start_time))
+        if i < len(self.nonzero):
+            return self.nonzero[i]
+        return len(self)
+
+    def close(self, begin):
+        """Find the first position at or after begin that is at the close."""
+        i = bisect_left(self.closes, begin)
+        if i < len(self.closes):
+            return self.closes[i]
+        return len(self)
+
+    def passage(self, begin, limit, stop):
+        """Find the first positions at or after begin where limit and stop are reached.
+
+        Args:
+            begin (int): Position of the starting value.
+            limit (float): Change to take profit at.
+            stop (float): Change to stop out at.
+
+        Returns:
+            tuple(int, int): Positions of the limit and the stop, len(self) if not reached.
+        """
+        start = self.values[begin]
+        end = len(self)
+
+        def change(value):
+            return round((value - start) / start, 4)
+
+        return (
+            self.first(self.highs, begin + 1, end, lambda v: change(v) >= limit),
+            self.first(self.lows, begin + 1, end, lambda v: change(v) <= stop),
+        )
+
 class BacktestWindow:
     """Test timeseries data against limits and stops"""
     def __init__(self, limit, stop, time, verbose):
         self.limit = limit
         self.stop = stop
         self.verbose = verbose
-        self.start_time = parse(time).time()
+        if isinstance(time, datetime.time):
+            self.start_time = time
+        else:
+            self.start_time = parse(time).time()
         self.times = []
         self.changed = 0
         self.start = 0
@@ -51,7 +189,9 @@ class BacktestWindow:
         """Apply an evaluation window to timeseries data
 
         Args:
-            df (dataframe): Timeseries data
+            df (dataframe|FirstPassageIndex|iterable): Timeseries data, an index built from it
+                or a stream of (time, value) tuples. Pass an index when evaluating the same
+                data more than once and a stream when the data is too large to hold in memory.
 
         Returns:
             dict of format:
@@ -62,56 +202,104 @@ class BacktestWindow:
                 start: start time
                 stop: stop time
         """
-        for i in df.itertuples():
-            time = utils.to_dst(i[5]).time()
-            value = i[6]
+        if isinstance(df, FirstPassageIndex):
+            index = df
+        elif isinstance(df, pd.DataFrame):
+            index = FirstPassageIndex(df)
+        else:
+            return self.eval_stream(df)
 
-            # Don't evaluate until we're ready
-            if time < self.start_time:
-                continue
+        # Don't evaluate until we're ready and have a starting value
+        begin = index.start(self.start_time)
+        if begin >= len(index):
+            return None
+        self.start = index.values[begin]
 
-            # Must have a starting value
-            if not self.start:
-                self.start = value
-                continue
+        # Don't evaluate in the power hour or in the morning
+        if self.start_time > POWER_HOUR or self.start_time < MORNING:
+            return None
 
-            # Don't evaluate in the power hour
-            if self.start_time > parse('14:59:00').time():
-                continue
+        limit, stop = index.passage(begin, self.limit, self.stop)
+        runaway = index.close(begin + 1)
+        end = min(limit, stop, runaway)
+        if end >= len(index):
+            return None
 
-            # Don't evaluate in the morning
-            if self.start_time < parse('09:59:00').time():
-                continue
+        self.times = index.times[begin + 1:end + 1]
+        self.changed = self.change(self.start, index.values[end])
 
-            self.times.append(time)
-            self.changed = self.change(self.start, value)
+        if self.verbose:
+            for time, value in zip(self.times, index.values[begin + 1:end + 1]):
+                print(f'{time} {self.change(self.start, value)}')
 
-            if self.verbose:
-                print(f'{self.times[-1]} {self.changed}')
+        if end == limit:
+            result = 'limit'
+        elif end == stop:
+            result = 'stop'
+        else:
+            result = 'runaway'
 
-            if self.changed >= self.limit:
-                if self.verbose:
-                    print('limit hit')
-                    print(f'{len(self.times)} minutes')
-                self.generate_results()
-                self.results['result'] = 'limit'
-                return self.results
+        if self.verbose:
+            print('runaway' if result == 'runaway' else f'{result} hit')
+            print(f'{len(self.times)} minutes')
+        self.generate_results()
+        self.results['result'] = result
+        return self.results
+
+    def eval_stream(self, records):
+        """Apply an evaluation window to a stream of timeseries data.
+
+        Records are consumed lazily and the stream is closed as soon as a
+        result is decided, so the rest of it is never downloaded.
+
+        Args:
+            records (iterable(tuple(datetime.datetime, float))): UTC times and values.
+
+        Returns:
+            Same as eval().
+        """
+        try:
+            for timestamp, value in records:
+                time = session.local_time(timestamp)
+
+                # Don't evaluate until we're ready
+                if time < self.start_time:
+                    continue
+
+                # Must have a starting value
+                if not self.start:
+                    self.start = value
+                    continue
+
+                # Don't evaluate in the power hour or in the morning
+                if self.start_time > POWER_HOUR or self.start_time < MORNING:
+                    return None
+
+                self.times.append(time)
+                self.changed = self.change(self.start, value)
 
-            if self.changed <= self.stop:
                 if self.verbose:
-                    print('stop hit')
-                    print(f'{len(self.times)} minutes')
-                self.generate_results()
-                self.results['result'] = 'stop'
-                return self.results
+                    print(f'{self.times[-1]} {self.changed}')
+
+                if self.changed >= self.limit:
+                    result = 'limit'
+                elif self.changed <= self.stop:
+                    result = 'stop'
+                elif time == session.CLOSE:
+                    result = 'runaway'
+                else:
+                    continue
 
-            if time == parse('16:00:00').time():
                 if self.verbose:
-                    print('runaway')
+                    print('runaway' if result == 'runaway' else f'{result} hit')
                     print(f'{len(self.times)} minutes')
                 self.generate_results()
-                self.results['result'] = 'runaway'
+                self.results['result'] = result
                 return self.results
+            return None
+        finally:
+            if hasattr(records, 'close'):
+                records.close()
 
     def generate_results(self):
         self.results['limit'] = self.limit
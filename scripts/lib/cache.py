@@ -0,0 +1,200 @@
+import os
+import json
+import hashlib
+import logging
+import pandas as pd
+from lib import session
+
+def match(tag, value):
+    """Build a flux predicate for a tag equal to a value or in a list of values."""
+    if isinstance(value, (list, tuple)):
+        values = ', '.join(f'"{v}"' for v in value)
+        return f'contains(value: r["{tag}"], set: [{values}])'
+    return f'r["{tag}"] == "{value}"'
+
+def flux(measurement, field, start, stop, every, fn='mean', **tags):
+    """Build a flux query for one field of a measurement aggregated into windows.
+
+    Args:
+        measurement (str): underlying|options
+        field (str): The field to return, e.g. last or mark.
+        start (str): UTC timestamp to start at.
+        stop (str): UTC timestamp to stop at.
+        every (str): The aggregation window, e.g. 30s. Raw points are returned if not set.
+        fn (str): The aggregation function.
+        **tags: Tags to filter on, e.g. symbol='SPY'. A list matches any of its values.
+
+    Returns:
+        str
+    """
+    filters = ''.join(f'\n        |> filter(fn: (r) => {match(k, v)})' for k, v in sorted(tags.items()))
+    window = f'\n        |> aggregateWindow(every: {every}, fn: {fn}, createEmpty: false)' if every else ''
+    return f"""
+    from(bucket: "main")
+        |> range(start: {start}, stop: {stop})
+        |> filter(fn: (r) => r["_measurement"] == "{measurement}"){filters}
+        |> filter(fn: (r) => r["_field"] == "{field}"){window}
+    """
+
+def flux_sessions(measurement, field, sessions, every, fn='mean', columns=('_time', '_value'), **tags):
+    """Build one flux query covering many sessions.
+
+    Each session gets its own range so nothing outside of session hours is
+    read. Results are unioned into one table and pruned to columns.
+
+    Args:
+        sessions (list(dict)): Sessions in the format of session.session().
+        columns (tuple): Columns to keep.
+        Everything else is the same as flux().
+
+    Returns:
+        str
+    """
+    tables = ',\n'.join(
+        flux(measurement, field, s['start'], s['stop'], every, fn, **tags).strip() for s in sessions
+    )
+    keep = ', '.join(f'"{c}"' for c in columns)
+    return f"""
+    union(tables: [
+    {tables}
+    ])
+        |> keep(columns: [{keep}])
+        |> group()
+        |> sort(columns: ["_time"])
+    """
+
+class QueryCache:
+    """Cache query results on disk as parquet files.
+
+    Results are keyed by the normalized query. Only ranges that have already
+    closed are cached since past sessions never change. Anything that reaches
+    into the still-open current day always goes to influx.
+    """
+    def __init__(self, source, path=None, max_bytes=None):
+        """
+        Args:
+            source (InfluxSource|LocalSource): Where to query on a miss.
+            path (str): Directory to store results in. Defaults to $RJ_CACHE_DIR or ~/.cache/rj.
+            max_bytes (int): Size to evict down to. Defaults to $RJ_CACHE_MB megabytes or 1GB.
+        """
+        self.source = source
+        self.path = os.path.expanduser(path or os.getenv('RJ_CACHE_DIR', '~/.cache/rj'))
+        self.max_bytes = max_bytes or int(os.getenv('RJ_CACHE_MB', '1024')) * 1024 * 1024
+        os.makedirs(self.path, exist_ok=True)
+
+    def query(self, measurement, field, start, stop, every, fn='mean', **tags):
+        """Query a measurement, using the cache when possible.
+
+        Args:
+            Same as flux().
+
+        Returns:
+            dataframe
+        """
+        if not self.source.cacheable or not self.closed(stop):
+            return self.source.query(measurement, field, start, stop, every, fn, **tags)
+
+        filename = self.filename(measurement, field, start, stop, every, fn, **tags)
+        if os.path.exists(filename):
+            os.utime(filename) # Mark as recently used
+            logging.debug('cache hit %s', filename)
+            return pd.read_parquet(filename)
+
+        df = self.source.query(measurement, field, start, stop, every, fn, **tags)
+        # Multiple tables come back as a list. Those aren't worth caching.
+        if isinstance(df, pd.DataFrame):
+            self.write(filename, df)
+        return df
+
+    def sessions(self, measurement, field, sessions, every, fn='mean', chunk=30, **tags):
+        """Query many sessions at once, using the cache when possible.
+
+        Sessions missing from the cache are fetched with one query per chunk
+        and split back out by session date.
+
+        Args:
+            sessions (list(dict)): Sessions in the format of session.session().
+            chunk (int): Max number of sessions per query.
+            Everything else is the same as flux().
+
+        Returns:
+            dict(datetime.date: dataframe) with only _time and _value columns.
+            Sessions without data get an empty dataframe.
+        """
+        columns = ('_time', '_value')
+        ret = {}
+        missing = []
+        for s in sessions:
+            filename = self.filename(measurement, field, s['start'], s['stop'], every, fn, columns, **tags)
+            if self.source.cacheable and self.closed(s['stop']) and os.path.exists(filename):
+                os.utime(filename) # Mark as recently used
+                ret[s['date']] = pd.read_parquet(filename)
+            else:
+                missing.append(s)
+
+        for i in range(0, len(missing), chunk):
+            batch = missing[i:i + chunk]
+            df = self.source.sessions(measurement, field, batch, every, fn, columns, **tags)
+            days = {}
+            if not df.empty:
+                df = df[list(columns)]
+                dates = session.to_local(df['_time']).dt.date
+                days = {d: g.reset_index(drop=True) for d, g in df.groupby(dates.to_numpy())}
+
+            for s in batch:
+                ret[s['date']] = days.get(s['date'], pd.DataFrame(columns=columns))
+                if self.source.cacheable and self.closed(s['stop']):
+                    self.write(
+                        self.filename(measurement, field, s['start'], s['stop'], every, fn, columns, **tags),
+                        ret[s['date']],
+                    )
+        return ret
+
+    @staticmethod
+    def closed(stop):
+        """Determine if a range has closed and its data can't change anymore.
+
+        Args:
+            stop (str): UTC timestamp the range stops at.
+
+        Returns:
+            bool
+        """
+        return pd.Timestamp(stop) < pd.Timestamp.now(tz='UTC')
+
+    def filename(self, measurement, field, start, stop, every, fn='mean', columns=None, **tags):
+        """Generate the file a query is cached in."""
+        key = json.dumps({
+            'columns': list(columns) if columns else None,
+            'measurement': measurement,
+            'field': field,
+            'start': pd.Timestamp(start).isoformat(),
+            'stop': pd.Timestamp(stop).isoformat(),
+            'every': every,
+            'fn': fn,
+            'tags': tags,
+        }, sort_keys=True)
+        return os.path.join(self.path, f'{hashlib.sha1(key.encode()).hexdigest()}.parquet')
+
+    def write(self, filename, df):
+        """Atomically write a result then evict the least recently used ones."""
+        tmp = f'{filename}.tmp'
+        df.to_parquet(tmp)
+        os.replace(tmp, filename)
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used results until the cache fits in max_bytes."""
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.parquet'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            logging.debug('cache evicted %s', path)
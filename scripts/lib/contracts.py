@@ -0,0 +1,100 @@
+import os
+import json
+import logging
+from datetime import datetime as dt
+import pandas as pd
+from lib.cache import QueryCache
+
+TAGS = ['symbol', 'exp', 'strike', 'putCall']
+
+class ContractIndex:
+    """Index of every options contract in influx and when it was seen.
+
+    The index is saved next to the query cache and only data newer than the
+    last refresh is scanned, so keeping it current is cheap. Lookups are
+    answered from memory.
+    """
+    def __init__(self, source, path=None, since='2021-01-01T00:00:00Z'):
+        """
+        Args:
+            source (InfluxSource|LocalSource): Where to scan.
+            path (str): File to save the index in. Defaults to contracts.json in the query cache.
+            since (str): UTC timestamp to start scanning at the first time the index is built.
+        """
+        self.source = source
+        self.path = path or os.path.join(QueryCache(source).path, 'contracts.json')
+        self.refreshed = since
+        self.contracts = {} # (symbol, exp, strike, putCall): [first, last]
+        self.by_strike = {} # (putCall, strike): [(exp, expiration date, first date, last date)]
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                saved = json.load(f)
+            self.refreshed = saved['refreshed']
+            self.contracts = {tuple(c[:4]): c[4:] for c in saved['contracts']}
+        self.reindex()
+
+    def refresh(self, stop=None):
+        """Scan data added since the last refresh and save the index.
+
+        Args:
+            stop (str): UTC timestamp to scan through. Defaults to now.
+        """
+        stop = stop or pd.Timestamp.now(tz='UTC').strftime('%Y-%m-%dT%H:%M:%SZ')
+        df = self.source.seen(self.refreshed, stop, TAGS)
+        for row in df.itertuples(index=False) if not df.empty else []:
+            key = (row.symbol, row.exp, float(row.strike), row.putCall)
+            first, last = pd.Timestamp(row.first).isoformat(), pd.Timestamp(row.last).isoformat()
+            if key in self.contracts:
+                first = min(first, self.contracts[key][0])
+                last = max(last, self.contracts[key][1])
+            self.contracts[key] = [first, last]
+
+        logging.debug('indexed %s contracts through %s', len(self.contracts), stop)
+        self.refreshed = stop
+        self.reindex()
+        self.save()
+
+    def reindex(self):
+        """Group contracts by strike with their dates parsed up front for lookups."""
+        self.by_strike = {}
+        for (_, exp, strike, putCall), (first, last) in self.contracts.items():
+            self.by_strike.setdefault((putCall, strike), []).append((
+                exp,
+                dt.strptime(exp, '%d %b %y'),
+                pd.Timestamp(first).date(),
+                pd.Timestamp(last).date(),
+            ))
+        for entries in self.by_strike.values():
+            entries.sort(key=lambda e: e[1])
+
+    def save(self):
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({
+                'refreshed': self.refreshed,
+                'contracts': [[*k, *v] for k, v in self.contracts.items()],
+            }, f)
+        os.replace(tmp, self.path)
+
+    def expirations(self, putCall, strike, ttl=None, before=None):
+        """Find expirations a strike has been traded at.
+
+        Args:
+            putCall (str): put|call
+            strike (float): The strike.
+            ttl (datetime.timedelta): Only include expirations that were seen
+                this long before they expired.
+            before (datetime.date): Only include expirations before this.
+
+        Returns:
+            list(str): Expirations sorted by date.
+        """
+        ret = []
+        for exp, date, first, last in self.by_strike.get((putCall, float(strike)), []):
+            if before and date.date() >= before:
+                continue
+            if ttl is not None and not first <= (date - ttl).date() <= last:
+                continue
+            if exp not in ret:
+                ret.append(exp)
+        return ret
@@ -0,0 +1,129 @@
+import datetime
+from datetime import datetime as dt
+from datetime import timedelta
+from dateutil import tz
+from dateutil.parser import parse
+import pandas as pd
+from pandas.tseries.holiday import (
+    AbstractHolidayCalendar, Holiday, GoodFriday, USMartinLutherKingJr, USPresidentsDay,
+    USMemorialDay, USLaborDay, USThanksgivingDay, nearest_workday, sunday_to_monday,
+)
+
+# Influx stores UTC. Sessions are defined in exchange local time so DST comes
+# from the tz database instead of hardcoded dates.
+TZ = 'America/New_York'
+OPEN = datetime.time(9, 30)
+CLOSE = datetime.time(16, 0)
+LOCAL = tz.gettz(TZ)
+
+class ExchangeHolidayCalendar(AbstractHolidayCalendar):
+    """Full day exchange holidays"""
+    rules = [
+        Holiday('New Years Day', month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday('Juneteenth', month=6, day=19, start_date='2022-06-19', observance=nearest_workday),
+        Holiday('Independence Day', month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday('Christmas', month=12, day=25, observance=nearest_workday),
+    ]
+
+def to_local(times):
+    """Convert timestamps to exchange local time in one vectorized call.
+
+    Args:
+        times (Series|DatetimeIndex|ndarray): UTC timestamps. Naive values are treated as UTC.
+
+    Returns:
+        Series of naive local timestamps if given a Series, otherwise a DatetimeIndex.
+    """
+    if isinstance(times, pd.Series):
+        if times.dt.tz is None:
+            times = times.dt.tz_localize('UTC')
+        return times.dt.tz_convert(TZ).dt.tz_localize(None)
+
+    times = pd.DatetimeIndex(times)
+    if times.tz is None:
+        times = times.tz_localize('UTC')
+    return times.tz_convert(TZ).tz_localize(None)
+
+def local_time(timestamp):
+    """Convert one timestamp to exchange local time of day.
+
+    Use to_local() for columns. This is for streams where values arrive one at a time.
+
+    Args:
+        timestamp (datetime.datetime): UTC timestamp. Naive values are treated as UTC.
+
+    Returns:
+        datetime.time
+    """
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    return timestamp.astimezone(LOCAL).time()
+
+def to_utc(date, time):
+    """Convert an exchange local date and time to a UTC timestamp for flux.
+
+    Args:
+        date (datetime.date): The session's date.
+        time (datetime.time): The local time of day.
+
+    Returns:
+        str
+    """
+    local = pd.Timestamp(dt.combine(date, time)).tz_localize(TZ)
+    return local.tz_convert('UTC').strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def session(date):
+    """Find the open and close of a session.
+
+    Args:
+        date (datetime.date): The session's date.
+
+    Returns:
+        dict of format:
+            date: the session's date
+            start: open as a UTC timestamp
+            stop: close as a UTC timestamp
+    """
+    return {'date': date, 'start': to_utc(date, OPEN), 'stop': to_utc(date, CLOSE)}
+
+def sessions(days, start=None, trading=False):
+    """Generate sessions at 1 day intervals going back from start.
+
+    Args:
+        days (int): The number of days to create sessions for.
+        start (str): The day to start with. Defaults to today.
+        trading (bool): Flag to skip weekends and holidays.
+
+    Returns:
+        list(dict) in the format of session()
+    """
+    if start:
+        _start = parse(start).date()
+    else:
+        _start = dt.utcnow().date()
+
+    dates = [_start - timedelta(days=i) for i in range(days)]
+    if trading and dates:
+        holidays = set(ExchangeHolidayCalendar().holidays(dates[-1], dates[0]).date)
+        dates = [d for d in dates if d.weekday() < 5 and d not in holidays]
+
+    return [session(d) for d in dates]
+
+def grid(seconds=30):
+    """Generate the times of day in a session, from the open through the close.
+
+    Args:
+        seconds (int): The interval between times.
+
+    Returns:
+        list(datetime.time)
+    """
+    day = datetime.date(2000, 1, 3) # Any day works, only the time is kept
+    times = pd.date_range(dt.combine(day, OPEN), dt.combine(day, CLOSE), freq=f'{seconds}s')
+    return [t.time() for t in times]
@@ -0,0 +1,329 @@
+import os
+import logging
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from influxdb_client import InfluxDBClient
+from lib.cache import flux, flux_sessions
+
+def connect():
+    """Connect to the configured data source.
+
+    Setting $RJ_DATA_DIR answers every query from local files in that directory.
+    Otherwise queries go to influx at $INFLUXDB_URL.
+
+    Returns:
+        InfluxSource|LocalSource
+    """
+    load_dotenv()
+    path = os.getenv('RJ_DATA_DIR')
+    if path:
+        return LocalSource(path)
+    return influx()
+
+def influx():
+    """Connect to influx at $INFLUXDB_URL.
+
+    Returns:
+        InfluxSource
+    """
+    load_dotenv()
+    token = os.environ['INFLUXDB_TOKEN']
+    url = os.environ['INFLUXDB_URL']
+    return InfluxSource(InfluxDBClient(url=url, token=token, org="default"))
+
+def lookup(measurement, field, start, stop, every, selector, **tags):
+    """Describe one value to fetch with batch().
+
+    Args:
+        selector (str): first|last, the window to keep.
+        Everything else is the same as flux().
+
+    Returns:
+        dict
+    """
+    return {
+        'measurement': measurement,
+        'field': field,
+        'start': start,
+        'stop': stop,
+        'every': every,
+        'selector': selector,
+        'tags': tags,
+    }
+
+def flux_batch(lookups):
+    """Build one query for many lookups.
+
+    Every lookup is tagged with its key and they're pivoted into one row per
+    key so the whole batch comes back as a single table.
+
+    Args:
+        lookups (dict(str: dict(str: dict))): Lookups by row and then column.
+
+    Returns:
+        str
+    """
+    tables = ',\n'.join(
+        f"""{flux(l['measurement'], l['field'], l['start'], l['stop'], l['every'], **l['tags']).strip()}
+        |> {l['selector']}()
+        |> set(key: "row", value: "{row}")
+        |> set(key: "column", value: "{column}")"""
+        for row, columns in lookups.items() for column, l in columns.items()
+    )
+    return f"""
+    union(tables: [
+    {tables}
+    ])
+        |> keep(columns: ["row", "column", "_value"])
+        |> group()
+        |> pivot(rowKey: ["row"], columnKey: ["column"], valueColumn: "_value")
+    """
+
+def flux_seen(start, stop, tags):
+    """Build a flux query for when every options contract was first and last seen.
+
+    Args:
+        start (str): UTC timestamp to start at.
+        stop (str): UTC timestamp to stop at.
+        tags (list(str)): Tags that identify a contract.
+
+    Returns:
+        str
+    """
+    tags = ', '.join(f'"{t}"' for t in tags)
+    return f"""
+    data = from(bucket: "main")
+        |> range(start: {start}, stop: {stop})
+        |> filter(fn: (r) => r["_measurement"] == "options")
+        |> filter(fn: (r) => r["_field"] == "mark")
+        |> keep(columns: ["_time", "_value", {tags}])
+        |> group(columns: [{tags}])
+
+    union(tables: [
+        data |> first() |> set(key: "seen", value: "first"),
+        data |> last() |> set(key: "seen", value: "last")
+    ])
+        |> group()
+        |> pivot(rowKey: [{tags}], columnKey: ["seen"], valueColumn: "_time")
+    """
+
+def frame(df):
+    """Combine the tables influx returns when series have different schemas."""
+    if isinstance(df, list):
+        return pd.concat(df) if df else pd.DataFrame()
+    return df
+
+
+class InfluxSource:
+    """Answer queries from influx"""
+    cacheable = True
+
+    def __init__(self, client):
+        """
+        Args:
+            client (InfluxDBClient): Connected client.
+        """
+        self.client = client
+        self.query_api = client.query_api()
+
+    def query(self, measurement, field, start, stop, every, fn='mean', **tags):
+        """Query one field of a measurement aggregated into windows.
+
+        Args:
+            Same as flux().
+
+        Returns:
+            dataframe, or a list of them if series come back with different schemas.
+        """
+        return self.query_api.query_data_frame(flux(measurement, field, start, stop, every, fn, **tags))
+
+    def sessions(self, measurement, field, sessions, every, fn='mean', columns=('_time', '_value'), **tags):
+        """Query many sessions at once.
+
+        Args:
+            Same as flux_sessions().
+
+        Returns:
+            dataframe sorted by _time with only columns.
+        """
+        return frame(self.query_api.query_data_frame(
+            flux_sessions(measurement, field, sessions, every, fn, columns, **tags)
+        ))
+
+    def stream(self, measurement, field, start, stop, every, fn='mean', **tags):
+        """Stream a query without loading it all.
+
+        Yields:
+            tuple(datetime.datetime, float): UTC time and value.
+        """
+        records = self.query_api.query_stream(flux(measurement, field, start, stop, every, fn, **tags))
+        try:
+            for record in records:
+                yield record.get_time(), record.get_value()
+        finally:
+            records.close()
+
+    def batch(self, lookups):
+        """Fetch many single values with one query.
+
+        Args:
+            lookups (dict(str: dict(str: dict))): lookup()s by row and then column.
+
+        Returns:
+            dataframe with a row column and a column per lookup column.
+        """
+        return frame(self.query_api.query_data_frame(flux_batch(lookups)))
+
+    def seen(self, start, stop, tags):
+        """Find when every options contract was first and last seen.
+
+        Returns:
+            dataframe with tags, first and last columns.
+        """
+        return frame(self.query_api.query_data_frame(flux_seen(start, stop, tags)))
+
+    def close(self):
+        self.client.close()
+
+
+class LocalSource:
+    """Answer queries from parquet files on disk.
+
+    Files are laid out as <path>/<measurement>/<YYYY-MM-DD>.parquet with one
+    file per UTC day. Each has _time, _field and _value columns plus a column
+    per tag. Windows are aggregated the same way influx's aggregateWindow does:
+    aligned to the epoch, stamped with the window's stop and without empty windows.
+    """
+    cacheable = False # Reading the files is as fast as the cache
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Directory the files are in.
+        """
+        self.path = os.path.expanduser(path)
+
+    def read(self, measurement, start, stop):
+        """Read every point of a measurement in [start, stop)."""
+        start, stop = pd.Timestamp(start), pd.Timestamp(stop)
+        directory = os.path.join(self.path, measurement)
+        day = start.date()
+        frames = []
+        while day <= stop.date():
+            filename = os.path.join(directory, f'{day.isoformat()}.parquet')
+            if os.path.exists(filename):
+                frames.append(pd.read_parquet(filename))
+            day += timedelta(days=1)
+        if not frames:
+            return pd.DataFrame()
+
+        df = pd.concat(frames, ignore_index=True)
+        return df[(df['_time'] >= start) & (df['_time'] < stop)]
+
+    @staticmethod
+    def select(df, field, **tags):
+        """Filter points the same way flux() does."""
+        if df.empty:
+            return df
+        keep = df['_field'] == field
+        for k, v in tags.items():
+            if k not in df:
+                return df.iloc[0:0]
+            if isinstance(v, (list, tuple)):
+                keep &= df[k].isin([str(i) for i in v])
+            else:
+                keep &= df[k] == str(v)
+        return df[keep]
+
+    @staticmethod
+    def aggregate(df, stop, every, fn='mean'):
+        """Aggregate each series into windows like aggregateWindow(createEmpty: false).
+
+        Args:
+            df (dataframe): Points of one field.
+            stop (str): UTC timestamp the range stops at. The last window is cut off here.
+            every (str): The window, e.g. 30s.
+            fn (str): mean|first|last|min|max|sum|count
+
+        Returns:
+            dataframe
+        """
+        width = pd.Timedelta(every).value
+        times = df['_time'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        stops = np.minimum((times // width + 1) * width, pd.Timestamp(stop).value)
+
+        series = [c for c in df.columns if c not in ('_time', '_value')]
+        df = df.assign(_time=pd.to_datetime(stops, utc=True))
+        return df.groupby(series + ['_time'], sort=True, dropna=False)['_value'].agg(fn).reset_index()
+
+    def query(self, measurement, field, start, stop, every, fn='mean', **tags):
+        """Same as InfluxSource.query()."""
+        df = self.select(self.read(measurement, start, stop), field, **tags)
+        if df.empty:
+            return pd.DataFrame()
+        if every:
+            df = self.aggregate(df, stop, every, fn)
+        else:
+            df = df.sort_values('_time', kind='stable')
+        return df.assign(_measurement=measurement).reset_index(drop=True)
+
+    def sessions(self, measurement, field, sessions, every, fn='mean', columns=('_time', '_value'), **tags):
+        """Same as InfluxSource.sessions()."""
+        frames = [self.query(measurement, field, s['start'], s['stop'], every, fn, **tags) for s in sessions]
+        frames = [f[list(columns)] for f in frames if not f.empty]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames).sort_values('_time', kind='stable').reset_index(drop=True)
+
+    def stream(self, measurement, field, start, stop, every, fn='mean', **tags):
+        """Same as InfluxSource.stream()."""
+        df = self.query(measurement, field, start, stop, every, fn, **tags)
+        if not df.empty:
+            yield from zip(df['_time'].dt.to_pydatetime(), df['_value'].tolist())
+
+    def batch(self, lookups):
+        """Same as InfluxSource.batch()."""
+        rows = []
+        for row, columns in lookups.items():
+            values = {'row': row}
+            for column, l in columns.items():
+                df = self.query(l['measurement'], l['field'], l['start'], l['stop'], l['every'], **l['tags'])
+                if not df.empty:
+                    values[column] = df['_value'].iloc[0 if l['selector'] == 'first' else -1]
+            rows.append(values)
+        return pd.DataFrame(rows)
+
+    def seen(self, start, stop, tags):
+        """Same as InfluxSource.seen()."""
+        df = self.select(self.read('options', start, stop), 'mark')
+        if df.empty:
+            return pd.DataFrame()
+        return df.groupby(tags)['_time'].agg(first='min', last='max').reset_index()
+
+    def write(self, measurement, df):
+        """Merge points into the files.
+
+        Args:
+            measurement (str): underlying|options
+            df (dataframe): Points with _time, _field and _value plus a column per tag.
+        """
+        directory = os.path.join(self.path, measurement)
+        os.makedirs(directory, exist_ok=True)
+        df = df.assign(_time=pd.to_datetime(df['_time'], utc=True))
+        series = [c for c in df.columns if c != '_value']
+
+        for day, points in df.groupby(df['_time'].dt.date):
+            filename = os.path.join(directory, f'{day.isoformat()}.parquet')
+            if os.path.exists(filename):
+                points = pd.concat([pd.read_parquet(filename), points], ignore_index=True)
+            points = points.drop_duplicates(series, keep='last').sort_values('_time', kind='stable')
+
+            tmp = f'{filename}.tmp'
+            points.to_parquet(tmp, index=False)
+            os.replace(tmp, filename)
+            logging.debug('wrote %s points to %s', len(points), filename)
+
+    def close(self):
+        pass
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+import argparse
+import itertools
+import os
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+import pandas as pd
+from backtest_rj import get_spy_timeseries_data
+import utils
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Sweep rj parameters over a day of SPY')
+    parser.add_argument('--start', help='day to start with', required=True)
+    parser.add_argument('-p', '--points', help='points as a list (2,4) or range (2:10:2)', required=True)
+    parser.add_argument('--change', help='change as a list or range', required=True)
+    parser.add_argument('-c', '--cooldown', help='cooldown as a list or range', default='30')
+    parser.add_argument('--horizon', help='points to hold for forward p&l', type=int)
+    parser.add_argument('-w', '--workers', help='worker processes', type=int, default=os.cpu_count())
+    parser.add_argument('-x', '--excel', help='output to excel', action='store_true')
+    return parser.parse_args()
+
+# Set in each worker by attach()
+values = None
+_shm = None
+
+def attach(name, size):
+    """Map the shared series into a worker."""
+    # pylint: disable=global-statement
+    global values, _shm
+    _shm = SharedMemory(name=name)
+    values = np.ndarray((size,), dtype=np.float64, buffer=_shm.buf)
+
+def changes(series, points):
+    """Calculate the change over every window of points.
+
+    Returns:
+        ndarray: Change for the window ending at each index, starting at points - 1.
+    """
+    start = series[:len(series) - points + 1]
+    return (series[points - 1:] - start) / start
+
+def triggers(series, points, change, cooldown):
+    """Find when backtest_rj.TestEvaluator would trigger.
+
+    Args:
+        series (ndarray): Prices.
+        points (int): The number of points in a window.
+        change (float): The amount of change to trigger on.
+        cooldown (int): Points to skip after a trigger.
+
+    Returns:
+        list(int): Indexes of the points that triggered.
+    """
+    raw = changes(series, points)
+    changed = np.round(raw, 4)
+    hit = changed >= change if change > 0 else changed <= change
+
+    # np.round and round() can disagree right at the threshold, so defer to round() there
+    for i in np.flatnonzero(np.abs(raw - change) < 1e-4):
+        c = round(float(raw[i]), 4)
+        hit[i] = c >= change if change > 0 else c <= change
+
+    hits = np.flatnonzero(hit) + points - 1
+    ret = []
+    i = 0
+    while i < len(hits):
+        ret.append(int(hits[i]))
+        if cooldown < 1: # The cooldown never ends
+            break
+        i = np.searchsorted(hits, hits[i] + cooldown)
+    return ret
+
+def evaluate(params):
+    """Evaluate one configuration against the shared series.
+
+    Args:
+        params (tuple): points, change, cooldown and horizon.
+
+    Returns:
+        dict
+    """
+    points, change, cooldown, horizon = params
+    found = triggers(values, points, change, cooldown)
+    ret = {'points': points, 'change': change, 'cooldown': cooldown, 'triggers': len(found)}
+
+    if horizon:
+        # Calls profit when price rises and puts when it falls
+        side = 1 if change > 0 else -1
+        held = [i for i in found if i + horizon < len(values)]
+        pnl = [side * (values[i + horizon] - values[i]) / values[i] for i in held]
+        ret['pnl'] = round(float(np.sum(pnl)), 4)
+        ret['win %'] = round(sum(p > 0 for p in pnl) / len(pnl) * 100, 2) if pnl else 0.0
+    return ret
+
+def sweep(series, grid, horizon=None, workers=None):
+    """Evaluate every configuration in a grid across a pool of processes.
+
+    Args:
+        series (ndarray): Prices.
+        grid (list(tuple)): points, change and cooldown for each configuration.
+        horizon (int): Points to hold for forward p&l. Skipped if not set.
+        workers (int): Number of processes.
+
+    Returns:
+        dataframe ranked by p&l if horizon is set, otherwise by triggers.
+    """
+    series = np.ascontiguousarray(series, dtype=np.float64)
+    shm = SharedMemory(create=True, size=max(series.nbytes, 1))
+    try:
+        np.ndarray(series.shape, dtype=np.float64, buffer=shm.buf)[:] = series
+        with Pool(workers, initializer=attach, initargs=(shm.name, len(series))) as pool:
+            chunksize = max(1, len(grid) // ((workers or os.cpu_count()) * 4))
+            results = pool.map(evaluate, [(*g, horizon) for g in grid], chunksize)
+    finally:
+        shm.close()
+        shm.unlink()
+
+    rank = ['pnl', 'triggers'] if horizon else ['triggers']
+    return pd.DataFrame(results).sort_values(rank, ascending=False, ignore_index=True)
+
+def main(start, points, change, cooldown, horizon=None, workers=None, excel=False):
+    # pylint: disable=too-many-arguments
+    df = get_spy_timeseries_data(start)
+    grid = list(itertools.product(points, change, cooldown))
+    print(f'[*] sweeping {len(grid)} configurations')
+
+    res = sweep(df['_value'].to_numpy(), grid, horizon, workers)
+    print(res.to_string())
+    if excel:
+        res.to_excel(f'sweep_{start}.xlsx')
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    main(
+        args.start,
+        utils.parse_grid(args.points, int),
+        utils.parse_grid(args.change, float),
+        utils.parse_grid(args.cooldown, int),
+        args.horizon,
+        args.workers,
+        args.excel,
+    )
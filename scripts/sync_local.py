@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+import os
+import argparse
+from lib import session, sources
+
+FIELDS = {
+    'underlying': ['last'],
+    'options': ['mark'],
+}
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Copy sessions from influx to local files for offline use')
+    parser.add_argument('-d', '--days', help='number of days to go back', type=int, default=30)
+    parser.add_argument('-s', '--start', help='day to start with', type=str)
+    parser.add_argument('-m', '--measurement', help='underlying, options or both', default='underlying,options')
+    parser.add_argument('-p', '--path', help='directory to write to, defaults to $RJ_DATA_DIR')
+    return parser.parse_args()
+
+def main(days, start, measurements, path):
+    src = sources.influx()
+    dst = sources.LocalSource(path)
+
+    for s in session.sessions(days, start, trading=True):
+        for measurement in measurements:
+            for field in FIELDS[measurement]:
+                # Raw points so any window can be aggregated locally
+                df = sources.frame(src.query(measurement, field, s['start'], s['stop'], None))
+                if df.empty:
+                    continue
+                df = df.drop(columns=['result', 'table', '_start', '_stop', '_measurement'], errors='ignore')
+                dst.write(measurement, df)
+                print(f"[*] {s['date']} {measurement} {field}: {len(df)} points")
+    src.close()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    main(
+        args.days,
+        args.start,
+        [m.strip() for m in args.measurement.split(',')],
+        args.path or os.environ['RJ_DATA_DIR'],
+    )
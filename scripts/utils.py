@@ -1,6 +1,4 @@
-from datetime import datetime as dt
-from datetime import timedelta
-from dateutil.parser import parse
+import numpy as np
 
 def change(start, current):
     """Calculate the percent of change between two values.
@@ -14,52 +12,6 @@ def change(start, current):
     """
     return round((current - start) / start, 4)
 
-def timestamps_per_day(days, start):
-    """Generate timestamps at 1 day intervals.
-
-    Args:
-        days (int): The number of days to create timestamps for.
-
-    Returns:
-        list(dict(list(dict)))
-    """
-
-    if start:
-        _start = parse(start)
-    else:
-        _start = dt.utcnow()
-
-
-    ret = []
-    for i in range(days):
-        start = dt.isoformat(
-            _start.replace(hour=13, minute=30, second=0, microsecond=0) - timedelta(days=i)
-        )
-        stop = dt.isoformat(
-            _start.replace(hour=20, minute=00, second=0, microsecond=0) - timedelta(days=i)
-        )
-
-        ret.append({i: [{'start': f'{start}Z', 'stop': f'{stop}Z'}]})
-
-    return ret
-
-def timestamps_one_day_by_minute(dst=True):
-    """Generate minute timestamps for one day.
-
-    Args:
-        dst (bool): Flag to convert timestamps to dst.
-
-    Returns:
-        list()
-    """
-    ret = []
-    start = dt.utcnow().replace(hour=13, minute=30, second=0, microsecond=0)
-
-    for i in range(0, 23430, 30):
-        ts = to_dst(start + timedelta(seconds=i)).strftime('%H:%M:%S')
-        ret.append(ts)
-    return ret
-
 def min(df):
    # pylint: disable=redefined-builtin
     return round(df['_value'].min(), 2)
@@ -109,15 +61,17 @@ def stats(df):
         'weekday': weekday(df)
     }
 
-def to_dst(timestamp):
-    _date = timestamp.strftime('%m-%d')
-    short_date = dt.strptime(_date, '%m-%d')
-
-    mar13 = dt.strptime('03-13', '%m-%d')
-    nov6 = dt.strptime('11-06', '%m-%d')
+def parse_grid(value, _type):
+    """Parse a comma separated list or start:stop:step range. Ranges include stop.
 
-    dst_offset = 4
-    if short_date < mar13 or short_date > nov6:
-        dst_offset = 5
+    Args:
+        value (str): The list or range.
+        _type (type): int or float.
 
-    return timestamp - timedelta(hours=dst_offset)
+    Returns:
+        list
+    """
+    if ':' in value:
+        start, stop, step = (_type(i) for i in value.split(':'))
+        return [_type(round(i, 6)) for i in np.arange(start, stop + step / 2, step)]
+    return [_type(i) for i in value.split(',')]
@@ -0,0 +1,95 @@
+from queue import Queue
+from datetime import datetime as dt
+import pytest
+import spivey
+from rj.chain import ChainPrefetcher
+from rj.clock import VirtualClock
+from rj.models import Trader
+import rj
+
+# pylint: skip-file
+
+### Fixtures
+@pytest.fixture
+def config(monkeypatch):
+    monkeypatch.setenv('CAPITAL', '1000')
+    monkeypatch.setenv('CLIENT_ID', 'asdf')
+    monkeypatch.setenv('REFRESH_TOKEN', 'asdf')
+    monkeypatch.setenv('TD_ACCOUNT_ID', 'asdf')
+    monkeypatch.setenv('TWILIO_ACCOUNT_SID', 'asdf')
+    monkeypatch.setenv('TWILIO_AUTH_TOKEN', 'asdf')
+    monkeypatch.setenv('DTE_MIN', '3')
+    monkeypatch.setenv('DTE_MAX', '5')
+    return rj.configure()
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Monkeypatch spivey to return fake data for options() and count calls"""
+    calls = []
+    def mock_options(*args):
+        calls.append(args)
+        return {
+            'putExpDateMap': {
+                '2022-05-16:1': [{'mark': 0.50}],
+                '2022-05-18:3': [{'mark': 0.55}],
+                '2022-05-20:5': [{'mark': 0.60}],
+                },
+            'callExpDateMap': {
+                '2022-05-16:1': [{'mark': 1.50}],
+                '2022-05-18:3': [{'mark': 1.55}],
+                '2022-05-23:8': [{'mark': 1.60}],
+                }
+        }
+    monkeypatch.setattr(spivey.Client, 'options', mock_options)
+    return calls
+
+@pytest.fixture
+def clock():
+    return VirtualClock(dt(2022, 5, 16, 14))
+
+@pytest.fixture
+def chains(config, clock, calls):
+    return ChainPrefetcher(config, clock=clock)
+
+### Tests
+class TestChainPrefetcher:
+    def test_that_only_dtes_in_range_are_kept(self, chains):
+        snapshot = chains.fetch()
+        assert list(snapshot['putExpDateMap']) == ['2022-05-18:3', '2022-05-20:5']
+        assert list(snapshot['callExpDateMap']) == ['2022-05-18:3']
+
+    def test_fresh_snapshots_are_reused(self, chains, clock, calls):
+        chains.fetch()
+        clock.sleep(chains.config['chain_max_age'])
+        chains.options()
+        assert len(calls) == 1
+
+    def test_stale_snapshots_are_refetched(self, chains, clock, calls):
+        chains.fetch()
+        clock.sleep(chains.config['chain_max_age'] + 1)
+        chains.options()
+        assert len(calls) == 2
+        assert chains.age() == 0
+
+    def test_fetching_when_theres_no_snapshot(self, chains, calls):
+        assert chains.age() is None
+        assert chains.options()['putExpDateMap']
+        assert len(calls) == 1
+
+    def test_prefetching_in_the_background(self, config, calls):
+        c = ChainPrefetcher(config) # Wall clock so the thread waits between fetches
+        c.daemon = True # Stop when pytest exits.
+        c.start()
+        while c.snapshot is None:
+            pass
+        assert len(calls) == 1
+
+class TestTraderWithChains:
+    def test_that_trader_reads_the_snapshot(self, config, chains, calls):
+        chains.fetch()
+        t = Trader(config, Queue(), chains=chains)
+        t.putCall = 'put'
+        t.find_exp_by_dte()
+        assert t.exp == '2022-05-18'
+        assert t.contracts[0]['mark'] == 0.55
+        assert len(calls) == 1
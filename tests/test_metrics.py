@@ -0,0 +1,72 @@
+from queue import Queue
+from datetime import datetime as dt
+import json
+import pytest
+from rj.clock import VirtualClock
+from rj.metrics import Metrics, MetricsExporter, mark, registry
+from rj.models import Evaluator, Order, Point
+
+# pylint: skip-file
+
+### Tests
+class TestMetrics:
+    def test_percentiles(self):
+        m = Metrics()
+        for i in range(1, 101):
+            m.observe('eval', i / 1000)
+        s = m.snapshot()['latencies']['eval']
+        assert s == {'count': 100, 'p50': 0.051, 'p99': 0.1, 'max': 0.1}
+
+    def test_that_only_recent_samples_are_kept(self):
+        m = Metrics(samples=2)
+        for i in [5.0, 1.0, 1.0]:
+            m.observe('eval', i)
+        s = m.snapshot()['latencies']['eval']
+        assert s['p99'] == 1.0
+        assert s['max'] == 5.0
+        assert s['count'] == 3
+
+    def test_recording_stages(self):
+        m = Metrics()
+        m.record({'fetch_start': 1.0, 'fetch_end': 1.5, 'enqueue': 1.75, 'eval': 2.0})
+        assert m.snapshot()['latencies']['fetch_end']['max'] == 0.5
+        assert m.snapshot()['latencies']['enqueue']['max'] == 0.25
+        assert 'fetch_start' not in m.snapshot()['latencies']
+
+    def test_recording_stages_since_a_mark(self):
+        m = Metrics()
+        m.record({'fetch_start': 1.0, 'eval': 2.0, 'chain': 2.5, 'buy_oco': 3.0},
+            since='eval', total='trigger')
+        latencies = m.snapshot()['latencies']
+        assert set(latencies) == {'chain', 'buy_oco', 'trigger'}
+        assert latencies['trigger']['max'] == 1.0
+
+class TestMarks:
+    def test_that_points_and_orders_carry_marks(self):
+        assert Point(dt.now().time(), 1.0).marks == {}
+        marks = mark({}, 'fetch_start')
+        assert Point(dt.now().time(), 1.0, marks).marks is marks
+        assert list(Order('put', 1.0, marks=marks).marks) == ['fetch_start']
+
+    def test_that_evaluator_passes_marks_to_orders(self):
+        e = Evaluator(2, 0.1, 2, Queue(), Queue())
+        e.daemon = True # Stop when pytest exits.
+        e.start()
+        for value in [1.0, 2.0]:
+            e.inq.put(Point(dt.now().time(), value, mark({}, 'fetch_start')))
+        order = e.outq.get(timeout=1)
+        assert list(order.marks) == ['fetch_start', 'eval', 'order_enqueue']
+        assert order.marks['fetch_start'] <= order.marks['eval'] <= order.marks['order_enqueue']
+
+class TestMetricsExporter:
+    def test_exporting_to_a_file(self, tmp_path):
+        m = Metrics()
+        m.observe('eval', 0.5)
+        q = Queue()
+        q.put(1)
+        path = tmp_path / 'metrics.json'
+        MetricsExporter(str(path), 60, {'pointq': q}, m, VirtualClock(dt(2022, 5, 16))).export()
+        data = json.loads(path.read_text())
+        assert data['gauges'] == {'pointq_depth': 1}
+        assert data['latencies']['eval']['p50'] == 0.5
+        assert data['time'] == '2022-05-16T00:00:00'
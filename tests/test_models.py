@@ -1,10 +1,13 @@
 from queue import Queue
 from datetime import datetime as dt
+from threading import Lock
+import asyncio
 import datetime
+import time
 import pytest
 import numpy as np
 import spivey
-from rj.models import Evaluator, Point, Order, Trader, Poller
+from rj.models import Evaluator, EvaluatorBank, Point, Order, Trader, Poller, AsyncPoller
 import rj
 
 # pylint: skip-file
@@ -124,6 +127,39 @@ class TestEvaluator:
         assert len(e.values) == 1
         assert len(e.times) == 1
 
+class TestEvaluatorBank:
+    configs = [
+        {'points': 4, 'change': 0.01, 'cooldown_points': 2},
+        {'points': 2, 'change': -0.01, 'cooldown_points': 5},
+        {'points': 6, 'change': 0.02, 'cooldown_points': 0, 'tag': 'wide'},
+    ]
+
+    def test_matches_separate_evaluators(self):
+        b = EvaluatorBank(self.configs, Queue(), Queue())
+        evaluators = [Evaluator(c['points'], c['change'], c['cooldown_points'], Queue(), Queue())
+            for c in self.configs]
+
+        rng = np.random.default_rng(0)
+        for value in 100 + np.cumsum(rng.normal(0, 0.5, 500)):
+            b.eval(dt.now().time(), float(value))
+            for e in evaluators:
+                e.eval(dt.now().time(), float(value))
+
+        tags = ['4:0.01:2', '2:-0.01:5', 'wide']
+        orders = list(b.outq.queue)
+        assert orders
+        for tag, e in zip(tags, evaluators):
+            expected = [(o.putCall, o.last) for o in e.outq.queue]
+            assert [(o.putCall, o.last) for o in orders if o.tag == tag] == expected
+
+    def test_that_cooldowns_are_independent(self):
+        b = EvaluatorBank(self.configs[:2], Queue(), Queue())
+        for value in [10.0, 10.0, 10.0, 10.5]:
+            b.eval(dt.now().time(), value)
+        assert b.outq.get_nowait().tag == '4:0.01:2'
+        assert b.cooldown_counters == [2, 0]
+        assert b.counts == [0, 4]
+
 class TestPoint:
     def test_that_timestamps_are_dt_objects(self):
         p = Point(dt.now().time(), 1.0)
@@ -154,6 +190,20 @@ class TestOrder:
         with pytest.raises(TypeError):
             Order('call', 1)
 
+    def test_that_tag_defaults_to_none(self):
+        assert Order('call', 1.1).tag is None
+        assert Order('call', 1.1, 'shadow').tag == 'shadow'
+
+class TestConfigure:
+    def test_parse_shadow(self):
+        assert rj.parse_shadow('4:0.0025:80,6:-0.003:10') == [
+            {'points': 4, 'change': 0.0025, 'cooldown_points': 80},
+            {'points': 6, 'change': -0.003, 'cooldown_points': 10},
+        ]
+
+    def test_shadow_defaults_to_empty(self, config):
+        assert config['shadow'] == []
+
 class TestTrader:
     def test_set_strike(self, trader):
         t = trader
@@ -234,3 +284,63 @@ class TestPoller:
         p.start()
         point = p.outq.get()
         assert point.value == 400.1
+
+class SlowClient:
+    """Fake broker client that takes a while to respond"""
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = Lock()
+
+    def underlying(self, ticker):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.calls.append((ticker, time.monotonic()))
+        time.sleep(self.latency)
+        with self.lock:
+            self.in_flight -= 1
+        return 400.1
+
+class TestAsyncPoller:
+    def test_polling_many_tickers(self, config, monkeypatch):
+        monkeypatch.setitem(config, 'polling_interval', 0.05)
+        outqs = {t: Queue() for t in ['SPY', 'QQQ', 'IWM']}
+        p = AsyncPoller(config, outqs, client=SlowClient(0.01))
+        asyncio.run(p.main(ticks=3))
+        assert all(q.qsize() == 3 for q in outqs.values())
+        assert outqs['QQQ'].get_nowait().value == 400.1
+
+    def test_that_latency_doesnt_cause_drift(self, config, monkeypatch):
+        monkeypatch.setitem(config, 'polling_interval', 0.05)
+        client = SlowClient(0.02)
+        p = AsyncPoller(config, {'SPY': Queue()}, client=client)
+        asyncio.run(p.main(ticks=10))
+        times = [t for _, t in client.calls]
+        # Sleeping after work would take 10 * 0.07
+        assert times[-1] - times[0] == pytest.approx(9 * 0.05, abs=0.02)
+
+    def test_that_the_request_budget_is_honored(self, config, monkeypatch):
+        monkeypatch.setitem(config, 'polling_interval', 0.05)
+        monkeypatch.setitem(config, 'max_requests', 2)
+        client = SlowClient(0.01)
+        p = AsyncPoller(config, {t: Queue() for t in 'ABCDEF'}, client=client)
+        asyncio.run(p.main(ticks=2))
+        assert len(client.calls) == 12
+        assert client.max_in_flight == 2
+
+    def test_that_failures_dont_stop_polling(self, config, monkeypatch):
+        monkeypatch.setitem(config, 'polling_interval', 0.01)
+        client = SlowClient(0)
+        responses = iter([RuntimeError('boom'), 400.1])
+        def underlying(ticker):
+            r = next(responses)
+            if isinstance(r, Exception):
+                raise r
+            return r
+        client.underlying = underlying
+        q = Queue()
+        asyncio.run(AsyncPoller(config, {'SPY': q}, client=client).main(ticks=2))
+        assert q.get_nowait().value == 400.1
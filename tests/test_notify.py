@@ -0,0 +1,82 @@
+from queue import Queue
+from datetime import datetime as dt
+import pytest
+from rj.clock import VirtualClock
+from rj.models import Trader
+from rj.notify import Notifier, FakeTransport, MAX_LENGTH
+import rj
+
+# pylint: skip-file
+
+### Fixtures
+@pytest.fixture
+def config(monkeypatch):
+    monkeypatch.setenv('CAPITAL', '1000')
+    monkeypatch.setenv('CLIENT_ID', 'asdf')
+    monkeypatch.setenv('REFRESH_TOKEN', 'asdf')
+    monkeypatch.setenv('TD_ACCOUNT_ID', 'asdf')
+    monkeypatch.setenv('TWILIO_ACCOUNT_SID', 'asdf')
+    monkeypatch.setenv('TWILIO_AUTH_TOKEN', 'asdf')
+    return rj.configure()
+
+@pytest.fixture
+def clock():
+    return VirtualClock(dt(2022, 5, 16, 14))
+
+def notifier(clock, failures=0, **kwargs):
+    return Notifier(FakeTransport(failures), clock=clock, **kwargs)
+
+### Tests
+class TestNotifier:
+    def test_that_bursts_are_coalesced(self, clock):
+        n = notifier(clock)
+        for msg in ['one', 'two', 'three']:
+            n.notify(msg)
+        n.dispatch()
+        assert n.transport.sent == ['one\n\ntwo\n\nthree']
+        assert n.q.unfinished_tasks == 0
+
+    def test_that_coalescing_respects_max_length(self, clock):
+        n = notifier(clock)
+        for msg in ['a' * 1000, 'b' * 1000, 'c']:
+            n.notify(msg)
+        n.dispatch()
+        n.dispatch()
+        assert n.transport.sent == ['a' * 1000, 'b' * 1000 + '\n\nc']
+        assert all(len(i) <= MAX_LENGTH for i in n.transport.sent)
+
+    def test_retrying_with_backoff(self, clock):
+        n = notifier(clock, failures=2, backoff=1.0)
+        start = clock.now()
+        n.notify('hi')
+        n.dispatch()
+        assert n.transport.sent == ['hi']
+        assert (clock.now() - start).total_seconds() == 3
+
+    def test_giving_up_after_retries(self, clock):
+        n = notifier(clock, failures=10, retries=2)
+        assert not n.send('hi')
+        assert n.transport.sent == []
+
+    def test_that_the_oldest_message_is_dropped_when_full(self, clock):
+        n = notifier(clock, maxsize=2)
+        for msg in ['one', 'two', 'three']:
+            n.notify(msg)
+        n.dispatch()
+        assert n.transport.sent == ['two\n\nthree']
+
+    def test_sending_in_the_background(self, clock):
+        n = notifier(clock)
+        n.daemon = True # Stop when pytest exits.
+        n.start()
+        n.notify('hi')
+        n.q.join()
+        assert n.transport.sent == ['hi']
+
+class TestTraderWithNotifier:
+    def test_that_trader_hands_off_messages(self, config, clock):
+        n = notifier(clock)
+        t = Trader(config, Queue(), notifier=n)
+        t.notify('hi')
+        assert n.q.get_nowait() == 'hi'
+        assert n.transport.sent == []
@@ -0,0 +1,69 @@
+from datetime import datetime as dt
+from datetime import timedelta
+import time
+import pytest
+import numpy as np
+from rj.clock import VirtualClock
+from rj.replay import ReplayBroker, replay, synthetic_chain
+import rj
+
+# pylint: skip-file
+
+### Fixtures
+@pytest.fixture
+def config(monkeypatch):
+    monkeypatch.setenv('CAPITAL', '1000')
+    monkeypatch.setenv('CLIENT_ID', 'asdf')
+    monkeypatch.setenv('REFRESH_TOKEN', 'asdf')
+    monkeypatch.setenv('TD_ACCOUNT_ID', 'asdf')
+    monkeypatch.setenv('TWILIO_ACCOUNT_SID', 'asdf')
+    monkeypatch.setenv('TWILIO_AUTH_TOKEN', 'asdf')
+    monkeypatch.setenv('CHANGE', '0.002')
+    monkeypatch.setenv('COOLDOWN_POINTS', '20')
+    return rj.configure()
+
+@pytest.fixture
+def series():
+    """One session of 30 second points"""
+    rng = np.random.default_rng(7)
+    start = dt(2022, 5, 16, 13, 30)
+    values = 400 + np.cumsum(rng.normal(0, 0.3, 781))
+    return [(start + timedelta(seconds=30 * i), float(v)) for i, v in enumerate(values)]
+
+### Tests
+class TestVirtualClock:
+    def test_sleep_advances_time(self):
+        c = VirtualClock(dt(2022, 5, 16, 13, 30))
+        c.sleep(30)
+        assert c.now() == dt(2022, 5, 16, 13, 30, 30)
+
+class TestReplayBroker:
+    def test_underlying_is_as_of_now(self, series):
+        c = VirtualClock(series[0][0] - timedelta(seconds=1))
+        b = ReplayBroker(series, c)
+        assert b.underlying('SPY') is None
+        c.sleep(46)
+        assert b.underlying('SPY') == series[1][1]
+
+    def test_synthetic_chain_skips_weekends(self):
+        chain = synthetic_chain(400.2, dt(2022, 5, 20, 14), 4)
+        assert list(chain['putExpDateMap']) == ['2022-05-20:0', '2022-05-23:3', '2022-05-24:4']
+        assert chain['callExpDateMap']['2022-05-20:0']['395.0'][0]['mark'] == 5.7
+
+class TestReplay:
+    def test_that_orders_are_placed(self, config, series):
+        orders = replay(config, series)
+        assert orders
+        assert all(o['symbol'].startswith('SPY_') for o in orders)
+        assert all(o['time'] <= series[-1][0] for o in orders)
+
+    def test_that_replays_are_deterministic(self, config, series):
+        assert replay(config, series) == replay(config, series)
+
+    def test_that_a_day_replays_quickly(self, config, series):
+        start = time.perf_counter()
+        replay(config, series)
+        assert time.perf_counter() - start < 1
+
+    def test_empty_series(self, config):
+        assert replay(config, []) == []
@@ -0,0 +1,115 @@
+from queue import Queue
+from datetime import datetime as dt
+import pytest
+import numpy as np
+from rj.clock import VirtualClock
+from rj.models import Evaluator, EvaluatorBank
+from rj.state import Checkpoint, warm_start
+import rj
+
+# pylint: skip-file
+
+### Fixtures
+@pytest.fixture
+def config(monkeypatch):
+    monkeypatch.setenv('CAPITAL', '1000')
+    monkeypatch.setenv('CLIENT_ID', 'asdf')
+    monkeypatch.setenv('REFRESH_TOKEN', 'asdf')
+    monkeypatch.setenv('TD_ACCOUNT_ID', 'asdf')
+    monkeypatch.setenv('TWILIO_ACCOUNT_SID', 'asdf')
+    monkeypatch.setenv('TWILIO_AUTH_TOKEN', 'asdf')
+    monkeypatch.setenv('POLLING_INTERVAL', '30')
+    monkeypatch.setenv('STATE_MAX_AGE', '90')
+    return rj.configure()
+
+@pytest.fixture
+def clock():
+    return VirtualClock(dt(2022, 5, 16, 14))
+
+@pytest.fixture
+def checkpoint(tmp_path, clock):
+    return Checkpoint(str(tmp_path / 'state.json'), clock)
+
+def feed(e, values, clock):
+    for v in values:
+        e.eval(clock.now().time(), v)
+        if e.checkpoint:
+            e.checkpoint.save(e.snapshot())
+        clock.sleep(30)
+
+def no_history(config, count, clock):
+    return []
+
+### Tests
+class TestCheckpoint:
+    def test_missing_file(self, checkpoint):
+        assert checkpoint.load() is None
+
+    def test_corrupt_file(self, checkpoint):
+        with open(checkpoint.path, 'w') as f:
+            f.write('{')
+        assert checkpoint.load() is None
+
+class TestWarmStart:
+    def test_restoring_a_fresh_window(self, config, clock, checkpoint):
+        e = Evaluator(4, 0.01, 2, Queue(), Queue(), checkpoint)
+        feed(e, [10.0, 10.0, 10.0], clock)
+
+        restarted = Evaluator(4, 0.01, 2, Queue(), Queue(), checkpoint)
+        warm_start(restarted, config, clock, no_history)
+        assert list(restarted.values) == [10.0, 10.0, 10.0]
+        assert list(restarted.times) == list(e.times)
+
+        # The first point after a restart can trigger
+        restarted.eval(clock.now().time(), 10.5)
+        assert restarted.outq.get_nowait().putCall == 'call'
+
+    def test_that_stale_windows_are_backfilled(self, config, clock, checkpoint):
+        e = Evaluator(4, 0.01, 2, Queue(), Queue(), checkpoint)
+        feed(e, [10.0, 10.0, 10.0], clock)
+        clock.sleep(600)
+
+        history = [(clock.now().time(), v) for v in [20.0, 20.0, 20.0, 20.0, 20.0]]
+        restarted = Evaluator(4, 0.01, 2, Queue(), Queue(), checkpoint)
+        warm_start(restarted, config, clock, lambda *args: history)
+        assert list(restarted.values) == [20.0, 20.0, 20.0, 20.0]
+
+    def test_that_cooldowns_survive_restarts(self, config, clock, checkpoint):
+        e = Evaluator(2, 0.01, 10, Queue(), Queue(), checkpoint)
+        feed(e, [10.0, 10.5], clock)
+        assert e.cooldown_counter == 10
+
+        # 4 points were missed while stopped
+        clock.sleep(90)
+        restarted = Evaluator(2, 0.01, 10, Queue(), Queue(), checkpoint)
+        warm_start(restarted, config, clock, lambda *args: pytest.fail('cooldowns dont need history'))
+        assert restarted.cooldown_counter == 6
+        assert not restarted.values
+
+    def test_that_changed_settings_are_ignored(self, config, clock, checkpoint):
+        e = Evaluator(4, 0.01, 2, Queue(), Queue(), checkpoint)
+        feed(e, [10.0, 10.0, 10.0], clock)
+
+        restarted = Evaluator(4, 0.02, 2, Queue(), Queue(), checkpoint)
+        warm_start(restarted, config, clock, no_history)
+        assert not restarted.values
+
+    def test_restoring_a_bank(self, config, clock, checkpoint):
+        configs = [
+            {'points': 4, 'change': 0.01, 'cooldown_points': 2},
+            {'points': 2, 'change': -0.01, 'cooldown_points': 5},
+        ]
+        rng = np.random.default_rng(0)
+        values = [float(v) for v in 100 + np.cumsum(rng.normal(0, 0.5, 200))]
+
+        # A bank restarted halfway through matches one that never stopped
+        b = EvaluatorBank(configs, Queue(), Queue(), checkpoint)
+        feed(b, values[:100], clock)
+        restarted = EvaluatorBank(configs, Queue(), b.outq, checkpoint)
+        warm_start(restarted, config, clock, no_history)
+
+        uninterrupted = EvaluatorBank(configs, Queue(), Queue())
+        feed(uninterrupted, values, VirtualClock(dt(2022, 5, 16, 14)))
+        feed(restarted, values[100:], clock)
+
+        assert [(o.tag, o.last) for o in b.outq.queue] == [(o.tag, o.last) for o in uninterrupted.outq.queue]